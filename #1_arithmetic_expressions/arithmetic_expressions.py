@@ -1,90 +1,98 @@
+import array
+import collections
+import concurrent.futures
+import heapq
+import keyword
+import math
+import operator
+import pickle
+import types
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
 class Value:
+    __slots__ = ()
+
     def __add__(self, other):
-        plus = create_operator('+', lambda lhs, rhs: lhs + rhs)
-        return create_expression((self, plus, other))
+        return create_expression((self, _BUILTIN_OPERATORS['+'], other))
 
     def __radd__(self, other):
         return Value.__add__(other, self)
 
     def __sub__(self, other):
-        minus = create_operator('-', lambda lhs, rhs: lhs - rhs)
-        return create_expression((self, minus, other))
+        return create_expression((self, _BUILTIN_OPERATORS['-'], other))
 
     def __rsub__(self, other):
         return Value.__sub__(other, self)
 
     def __mul__(self, other):
-        times = create_operator('*', lambda lhs, rhs: lhs * rhs)
-        return create_expression((self, times, other))
+        return create_expression((self, _BUILTIN_OPERATORS['*'], other))
 
     def __rmul__(self, other):
         return Value.__mul__(other, self)
 
     def __truediv__(self, other):
-        div = create_operator('/', lambda lhs, rhs: lhs / rhs)
-        return create_expression((self, div, other))
+        return create_expression((self, _BUILTIN_OPERATORS['/'], other))
 
     def __rtruediv__(self, other):
         return Value.__truediv__(other, self)
 
     def __floordiv__(self, other):
-        fdiv = create_operator('//', lambda lhs, rhs: lhs // rhs)
-        return create_expression((self, fdiv, other))
+        return create_expression((self, _BUILTIN_OPERATORS['//'], other))
 
     def __rfloordiv__(self, other):
         return Value.__floordiv__(other, self)
 
     def __mod__(self, other):
-        mod = create_operator('%', lambda lhs, rhs: lhs % rhs)
-        return create_expression((self, mod, other))
+        return create_expression((self, _BUILTIN_OPERATORS['%'], other))
 
     def __rmod__(self, other):
         return Value.__mod__(other, self)
 
     def __pow__(self, other):
-        pw = create_operator('**', lambda lhs, rhs: lhs ** rhs)
-        return create_expression((self, pw, other))
+        return create_expression((self, _BUILTIN_OPERATORS['**'], other))
 
     def __rpow__(self, other):
         return Value.__pow__(other, self)
 
     def __lshift__(self, other):
-        lshift = create_operator('<<', lambda lhs, rhs: lhs << rhs)
-        return create_expression((self, lshift, other))
+        return create_expression((self, _BUILTIN_OPERATORS['<<'], other))
 
     def __rlshift__(self, other):
         return Value.__lshift__(other, self)
 
     def __rshift__(self, other):
-        rshift = create_operator('>>', lambda lhs, rhs: lhs >> rhs)
-        return create_expression((self, rshift, other))
+        return create_expression((self, _BUILTIN_OPERATORS['>>'], other))
 
     def __rrshift__(self, other):
         return Value.__rshift__(other, self)
 
     def __and__(self, other):
-        and_op = create_operator('&', lambda lhs, rhs: lhs & rhs)
-        return create_expression((self, and_op, other))
+        return create_expression((self, _BUILTIN_OPERATORS['&'], other))
 
     def __rand__(self, other):
         return Value.__and__(other, self)
 
     def __xor__(self, other):
-        xor_op = create_operator('^', lambda lhs, rhs: lhs ^ rhs)
-        return create_expression((self, xor_op, other))
+        return create_expression((self, _BUILTIN_OPERATORS['^'], other))
 
     def __rxor__(self, other):
         return Value.__xor__(other, self)
 
     def __or__(self, other):
-        or_op = create_operator('|', lambda lhs, rhs: lhs | rhs)
-        return create_expression((self, or_op, other))
+        return create_expression((self, _BUILTIN_OPERATORS['|'], other))
 
     def __ror__(self, other):
         return Value.__or__(other, self)
 
 
 class Constant(Value):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
@@ -96,6 +104,8 @@ class Constant(Value):
 
 
 class Variable(Value):
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
@@ -111,9 +121,12 @@ class Variable(Value):
 
 
 class Operator:
-    def __init__(self, symbol, function):
+    __slots__ = ('symbol', 'function', 'pure')
+
+    def __init__(self, symbol, function, pure=True):
         self.symbol = symbol
         self.function = function
+        self.pure = pure
 
     def call(self, *args):
         return self.function(*args)
@@ -127,68 +140,471 @@ class Operator:
 
 
 class Expression(Value):
-    def __init__(self, expression_structure):
-        self.expression_structure = expression_structure
-
-    def evaluate(self, **variables):
-        operand1 = self.expression_structure[0]
-        operand2 = self.expression_structure[2]
-        func = self.expression_structure[1]
-
-        if type(operand1) is tuple or type(operand1) is list:
-            operand1 = create_constant(create_expression(operand1).
-                                       evaluate(**variables))
+    __slots__ = ('left', 'operator', 'right')
 
-        elif isinstance(operand1, (int, float, complex)):
-            operand1 = create_constant(operand1)
+    def __init__(self, expression_structure):
+        self.left = _operand(expression_structure[0])
+        self.operator = expression_structure[1]
+        self.right = _operand(expression_structure[2])
 
-        if type(operand2) is tuple or type(operand2) is list:
-            operand2 = create_constant(create_expression(operand2).
-                                       evaluate(**variables))
+    @property
+    def expression_structure(self):
+        return (self.left, self.operator, self.right)
 
-        elif isinstance(operand2, (int, float, complex)):
-            operand2 = create_constant(operand2)
+    def compact(self):
+        return ExpressionArena(self)
 
-        return func.call(operand1.evaluate(**variables),
-                         operand2.evaluate(**variables))
+    def evaluate(self, **variables):
+        values = {}
+        for node in _postorder(self):
+            if isinstance(node, Expression):
+                values[id(node)] = node.operator.call(values[id(node.left)],
+                                                      values[id(node.right)])
+            elif isinstance(node, Variable):
+                values[id(node)] = variables[node.name]
+            elif isinstance(node, Constant):
+                values[id(node)] = node.value
+            else:
+                values[id(node)] = node.evaluate(**variables)
+        return values[id(self)]
+
+    def evaluate_batch(self, **columns):
+        if numpy is None:
+            raise ImportError('evaluate_batch requires numpy')
+        values = {}
+        for node in _postorder(self):
+            if isinstance(node, Expression):
+                lhs, rhs = values[id(node.left)], values[id(node.right)]
+                symbol = node.operator.get_symbol
+                builtin = _BUILTIN_OPERATORS.get(symbol)
+                if builtin is not None and \
+                        node.operator.function is builtin.function:
+                    value = getattr(numpy, _UFUNC_NAMES[symbol])(lhs, rhs)
+                else:
+                    value = numpy.frompyfunc(node.operator.function, 2, 1)(
+                        lhs, rhs)
+                    if isinstance(value, numpy.ndarray):
+                        value = numpy.array(value.tolist())
+            elif isinstance(node, Variable):
+                value = numpy.asarray(columns[node.name])
+            else:
+                value = node.evaluate()
+            values[id(node)] = value
+        return values[id(self)]
+
+    def simplify(self, report=False):
+        simplified = {}
+        for node in _postorder(self):
+            if isinstance(node, Expression):
+                simplified[id(node)] = _simplify_node(
+                    node, simplified[id(node.left)],
+                    simplified[id(node.right)])
+            else:
+                simplified[id(node)] = node
+        result = simplified[id(self)]
+        if not report:
+            return result
+        before = _node_count(self)
+        after = _node_count(result)
+        return result, {'before': before, 'after': after,
+                        'removed': before - after}
+
+    def compile(self):
+        namespace = {}
+        parameters = {}
+        local_names = {}
+        functions = {}
+        body = []
+        for node in _postorder(self):
+            if isinstance(node, Expression):
+                function = node.operator.function
+                if id(function) not in functions:
+                    functions[id(function)] = '_f{}'.format(len(functions))
+                    namespace[functions[id(function)]] = function
+                local_name = '_t{}'.format(len(body))
+                body.append('    {} = {}({}, {})'.format(
+                    local_name, functions[id(function)],
+                    local_names[id(node.left)], local_names[id(node.right)]))
+            elif isinstance(node, Variable):
+                if node.name not in parameters:
+                    parameters[node.name] = _parameter_name(node.name,
+                                                            len(parameters))
+                local_name = parameters[node.name]
+            else:
+                local_name = '_c{}'.format(len(namespace))
+                namespace[local_name] = node.evaluate()
+            local_names[id(node)] = local_name
+
+        variables = tuple(sorted(parameters, key=str))
+        source = 'def _compiled({}):\n{}\n    return {}\n'.format(
+            ', '.join(parameters[name] for name in variables),
+            '\n'.join(body), local_names[id(self)])
+        exec(source, namespace)
+        compiled = namespace['_compiled']
+        compiled.variables = variables
+        return compiled
 
     def __str__(self):
-        operand1 = self.expression_structure[0]
-        operand2 = self.expression_structure[2]
-        func = self.expression_structure[1]
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+            elif isinstance(node, Expression):
+                stack.extend((')', node.right,
+                              ' {} '.format(node.operator.get_symbol),
+                              node.left, '('))
+            else:
+                parts.append(str(node))
+        return ''.join(parts)
 
-        if type(operand1) is tuple or type(operand1) is list:
-            operand1 = str(create_expression(operand1))
+    @property
+    def variable_names(self):
+        return {node.get_name for node in _postorder(self)
+                if isinstance(node, Variable)}
+
+
+class Interner:
+    def __init__(self):
+        self.nodes = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def constant(self, value):
+        return self._lookup(_constant_key(value),
+                            lambda: create_constant(value))
+
+    def variable(self, name):
+        return self._lookup(('variable', name), lambda: create_variable(name))
+
+    def operator(self, symbol, function, pure=True):
+        if not pure:
+            return create_operator(symbol, function, pure)
+        return self._lookup(('operator', symbol, _function_key(function)),
+                            lambda: create_operator(symbol, function))
+
+    def expression(self, expression_structure):
+        return self.intern(create_expression(expression_structure))
+
+    def intern(self, root):
+        root = _operand(root)
+        canonical = {}
+        for node in _postorder(root):
+            if isinstance(node, Expression):
+                left = canonical[id(node.left)]
+                right = canonical[id(node.right)]
+                if node.operator.pure:
+                    op = self.operator(node.operator.get_symbol,
+                                       node.operator.function)
+                    interned = self._lookup(
+                        ('expression', id(left), id(op), id(right)),
+                        lambda: create_expression((left, op, right)))
+                else:
+                    interned = create_expression((left, node.operator, right))
+            elif isinstance(node, Constant):
+                interned = self.constant(node.value)
+            elif isinstance(node, Variable):
+                interned = self.variable(node.name)
+            else:
+                interned = node
+            canonical[id(node)] = interned
+        return canonical[id(root)]
+
+    def _lookup(self, key, factory):
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.nodes[key] = factory()
+        return node
+
+
+class ExpressionArena:
+    CONSTANT = 0
+    VARIABLE = 1
+
+    def __init__(self, root):
+        self.opcodes = array.array('I')
+        self.lefts = array.array('q')
+        self.rights = array.array('q')
+        self.constants = []
+        self.names = []
+        self.operators = []
+        rows = {}
+        names = {}
+        operators = {}
+        for node in _postorder(_operand(root)):
+            if isinstance(node, Expression):
+                op = node.operator
+                key = (op.get_symbol, _function_key(op.function), op.pure)
+                if key not in operators:
+                    operators[key] = len(self.operators)
+                    self.operators.append(op)
+                self._append(self.VARIABLE + 1 + operators[key],
+                             rows[id(node.left)], rows[id(node.right)])
+            elif isinstance(node, Variable):
+                if node.name not in names:
+                    names[node.name] = len(self.names)
+                    self.names.append(node.name)
+                self._append(self.VARIABLE, names[node.name], -1)
+            else:
+                self.constants.append(node.evaluate())
+                self._append(self.CONSTANT, len(self.constants) - 1, -1)
+            rows[id(node)] = len(self.opcodes) - 1
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def _append(self, opcode, left, right):
+        self.opcodes.append(opcode)
+        self.lefts.append(left)
+        self.rights.append(right)
 
-        if type(operand2) is tuple or type(operand2) is list:
-            operand2 = str(create_expression(operand2))
+    def evaluate(self, **variables):
+        constants = self.constants
+        names = self.names
+        functions = [op.call for op in self.operators]
+        values = []
+        for opcode, left, right in zip(self.opcodes, self.lefts, self.rights):
+            if opcode == self.CONSTANT:
+                values.append(constants[left])
+            elif opcode == self.VARIABLE:
+                values.append(variables[names[left]])
+            else:
+                values.append(functions[opcode - self.VARIABLE - 1](
+                    values[left], values[right]))
+        return values[-1]
+
+    def to_expression(self):
+        nodes = []
+        for opcode, left, right in zip(self.opcodes, self.lefts, self.rights):
+            if opcode == self.CONSTANT:
+                nodes.append(create_constant(self.constants[left]))
+            elif opcode == self.VARIABLE:
+                nodes.append(create_variable(self.names[left]))
+            else:
+                nodes.append(create_expression(
+                    (nodes[left], self.operators[opcode - self.VARIABLE - 1],
+                     nodes[right])))
+        return nodes[-1]
+
+
+class EvaluationContext:
+    def __init__(self, expression, **variables):
+        self.expression = _operand(expression)
+        self.variables = variables
+        self.nodes = list(_postorder(self.expression))
+        self.positions = {id(node): position
+                          for position, node in enumerate(self.nodes)}
+        self.parents = {}
+        self.dependencies = {}
+        for position, node in enumerate(self.nodes):
+            if isinstance(node, Expression):
+                for child in {id(node.left), id(node.right)}:
+                    self.parents.setdefault(child, []).append(position)
+            elif isinstance(node, Variable):
+                self.dependencies.setdefault(node.name, []).append(position)
+        self.values = [None] * len(self.nodes)
+        self.dirty = set()
+        for position in range(len(self.nodes)):
+            self._compute(position)
 
-        return "({} {} {})".format(str(operand1),
-                                   func.get_symbol, str(operand2))
+    @property
+    def value(self):
+        return self.values[-1]
 
     @property
     def variable_names(self):
-        names = set()
-        operand1 = self.expression_structure[0]
-        operand2 = self.expression_structure[2]
-
-        if type(operand1) is tuple or type(operand1) is list:
-            operand1 = create_expression(operand1)
-            names = names.union(operand1.variable_names)
-        elif type(operand1) is Expression:
-            names = names.union(operand1.variable_names)
-        elif type(operand1) is Variable:
-            names = names.union(operand1.get_name)
-
-        if type(operand2) is tuple or type(operand2) is list:
-            operand2 = create_expression(operand2)
-            names = names.union(operand2.variable_names)
-        elif type(operand2) is Expression:
-            names = names.union(operand2.variable_names)
-        elif type(operand2) is Variable:
-            names = names.union(operand2.get_name)
+        return set(self.dependencies)
+
+    def update(self, **variables):
+        self.variables.update(variables)
+        queued = set(self.dirty)
+        for name in variables:
+            queued.update(self.dependencies.get(name, ()))
+        queue = list(queued)
+        heapq.heapify(queue)
+        while queue:
+            position = heapq.heappop(queue)
+            try:
+                self._compute(position)
+            except Exception:
+                self.dirty = set(queue)
+                self.dirty.add(position)
+                raise
+            for parent in self.parents.get(id(self.nodes[position]), ()):
+                if parent not in queued:
+                    heapq.heappush(queue, parent)
+                    queued.add(parent)
+        self.dirty = set()
+        return self.value
 
-        return names
+    def _compute(self, position):
+        node = self.nodes[position]
+        if isinstance(node, Expression):
+            value = node.operator.call(
+                self.values[self.positions[id(node.left)]],
+                self.values[self.positions[id(node.right)]])
+        elif isinstance(node, Variable):
+            value = self.variables[node.name]
+        else:
+            value = node.evaluate(**self.variables)
+        self.values[position] = value
+
+
+class EvaluationCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.enabled = True
+        self.entries = collections.OrderedDict()
+        self.structures = collections.OrderedDict()
+        self.shapes = {}
+        self.next_shape = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.structures.clear()
+        self.shapes.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def evaluate(self, expression, **variables):
+        key = self.key(expression, variables) if self.enabled else None
+        if key is None:
+            return expression.evaluate(**variables)
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        value = self.entries[key] = expression.evaluate(**variables)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def key(self, expression, variables):
+        shape, names = self._shape(expression)
+        if shape is None:
+            return None
+        try:
+            return shape, frozenset(
+                (name, type(variables[name]), variables[name],
+                 _zero_signs(variables[name])) for name in names)
+        except (KeyError, TypeError):
+            return None
+
+    def _shape(self, expression):
+        cached = self.structures.get(id(expression))
+        if cached is not None and cached[0] is expression:
+            self.structures.move_to_end(id(expression))
+            return cached[1:]
+        structure = structural_key(expression)
+        if structure is None:
+            shape, names = None, ()
+        else:
+            if structure not in self.shapes:
+                self.shapes[structure] = self.next_shape
+                self.next_shape += 1
+                if len(self.shapes) > self.maxsize:
+                    del self.shapes[next(iter(self.shapes))]
+            shape = self.shapes[structure]
+            names = {item[1] for item in structure if item[0] == 'variable'}
+        self.structures[id(expression)] = (expression, shape, names)
+        if len(self.structures) > self.maxsize:
+            self.structures.popitem(last=False)
+        return shape, names
+
+
+def structural_key(root):
+    key = []
+    positions = {}
+    for node in _postorder_with_repeats(_operand(root)):
+        if id(node) in positions:
+            key.append(('reference', positions[id(node)]))
+            continue
+        if isinstance(node, Expression):
+            if not node.operator.pure:
+                return None
+            key.append(('operator', node.operator.get_symbol,
+                        _function_key(node.operator.function)))
+        elif isinstance(node, Variable):
+            key.append(('variable', node.name))
+        elif isinstance(node, Constant):
+            try:
+                hash(node.value)
+            except TypeError:
+                return None
+            key.append(_constant_key(node.value))
+        else:
+            return None
+        positions[id(node)] = len(key) - 1
+    return tuple(key)
+
+
+EvaluationResult = collections.namedtuple('EvaluationResult', 'value error')
+
+
+def evaluate_many(expressions, bindings, workers=None, chunksize=64):
+    expressions = list(expressions)
+    if isinstance(bindings, dict):
+        bindings = [bindings] * len(expressions)
+    bindings = list(bindings)
+    if len(bindings) != len(expressions):
+        raise ValueError('evaluate_many got {} expressions but {} bindings'
+                         .format(len(expressions), len(bindings)))
+    results = [None] * len(expressions)
+    payloads = []
+    for index, (expression, variables) in enumerate(zip(expressions,
+                                                        bindings)):
+        try:
+            arena = ExpressionArena(expression)
+        except Exception as error:
+            results[index] = EvaluationResult(None, error)
+            continue
+        try:
+            payloads.append((index, pickle.dumps((arena, variables))))
+        except (pickle.PicklingError, AttributeError, TypeError):
+            results[index] = _evaluate_arena(arena, variables)
+    chunks = [payloads[start:start + chunksize]
+              for start in range(0, len(payloads), chunksize)]
+
+    if workers is not None and workers <= 1:
+        _collect_chunks(results, map(_evaluate_chunk, chunks))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            _collect_chunks(results, executor.map(_evaluate_chunk, chunks))
+    return results
+
+
+def _collect_chunks(results, chunks):
+    for chunk in chunks:
+        for index, result in chunk:
+            results[index] = result
+
+
+def _evaluate_chunk(payloads):
+    results = []
+    for index, payload in payloads:
+        try:
+            arena, variables = pickle.loads(payload)
+        except Exception as error:
+            results.append((index, EvaluationResult(None, error)))
+            continue
+        results.append((index, _evaluate_arena(arena, variables)))
+    return results
+
+
+def _evaluate_arena(arena, variables):
+    try:
+        return EvaluationResult(arena.evaluate(**variables), None)
+    except Exception as error:
+        return EvaluationResult(None, error)
 
 
 def create_constant(value):
@@ -199,9 +615,131 @@ def create_variable(name):
     return Variable(name)
 
 
-def create_operator(symbol, function):
-    return Operator(symbol, function)
+def create_operator(symbol, function, pure=True):
+    return Operator(symbol, function, pure)
 
 
 def create_expression(expression_structure):
-    return Expression(expression_structure)
\ No newline at end of file
+    return Expression(expression_structure)
+
+
+_BUILTIN_OPERATORS = {
+    symbol: create_operator(symbol, function) for symbol, function in (
+        ('+', operator.add),
+        ('-', operator.sub),
+        ('*', operator.mul),
+        ('/', operator.truediv),
+        ('//', operator.floordiv),
+        ('%', operator.mod),
+        ('**', operator.pow),
+        ('<<', operator.lshift),
+        ('>>', operator.rshift),
+        ('&', operator.and_),
+        ('^', operator.xor),
+        ('|', operator.or_)
+    )
+}
+
+_UFUNC_NAMES = {
+    '+': 'add',
+    '-': 'subtract',
+    '*': 'multiply',
+    '/': 'true_divide',
+    '//': 'floor_divide',
+    '%': 'remainder',
+    '**': 'power',
+    '<<': 'left_shift',
+    '>>': 'right_shift',
+    '&': 'bitwise_and',
+    '^': 'bitwise_xor',
+    '|': 'bitwise_or'
+}
+
+
+def _operand(operand):
+    if type(operand) is tuple or type(operand) is list:
+        return create_expression(operand)
+    elif isinstance(operand, (int, float, complex)):
+        return create_constant(operand)
+    return operand
+
+
+def _postorder(root):
+    visited = set()
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in visited:
+            continue
+        if expanded or not isinstance(node, Expression):
+            visited.add(id(node))
+            yield node
+        else:
+            stack.append((node, True))
+            stack.append((node.right, False))
+            stack.append((node.left, False))
+
+
+def _simplify_node(node, left, right):
+    if not node.operator.pure:
+        if left is node.left and right is node.right:
+            return node
+        return create_expression((left, node.operator, right))
+    if isinstance(left, Constant) and isinstance(right, Constant):
+        try:
+            return create_constant(node.operator.call(left.value,
+                                                      right.value))
+        except Exception:
+            pass
+    if left is node.left and right is node.right:
+        return node
+    return create_expression((left, node.operator, right))
+
+
+def _node_count(root):
+    return sum(1 for _ in _postorder(root))
+
+
+def _constant_key(value):
+    try:
+        hash(value)
+    except TypeError:
+        return ('constant', id(value))
+    return ('constant', type(value), value, _zero_signs(value))
+
+
+def _zero_signs(value):
+    if isinstance(value, float):
+        return math.copysign(1, value)
+    if isinstance(value, complex):
+        return math.copysign(1, value.real), math.copysign(1, value.imag)
+    return None
+
+
+def _function_key(function):
+    if type(function) is not types.FunctionType or function.__closure__ or \
+            function.__defaults__ or function.__kwdefaults__:
+        return function
+    return (function.__code__, id(function.__globals__))
+
+
+def _postorder_with_repeats(root):
+    visited = set()
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded or id(node) in visited or \
+                not isinstance(node, Expression):
+            visited.add(id(node))
+            yield node
+        else:
+            stack.append((node, True))
+            stack.append((node.right, False))
+            stack.append((node.left, False))
+
+
+def _parameter_name(name, index):
+    if isinstance(name, str) and name.isidentifier() and \
+            not keyword.iskeyword(name) and not name.startswith('_'):
+        return name
+    return '_v{}'.format(index)
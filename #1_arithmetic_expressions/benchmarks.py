@@ -0,0 +1,278 @@
+import random
+import timeit
+import tracemalloc
+
+from arithmetic_expressions import (create_constant, create_variable,
+                                    create_operator, create_expression,
+                                    numpy, Interner, Constant, Variable,
+                                    Operator, Expression, EvaluationContext,
+                                    EvaluationCache, evaluate_many)
+
+
+def sample_expression():
+    x = create_variable('x')
+    y = create_variable('y')
+    return (x * 3 + y) * (x - y) / 7 + (x % 5) * 2
+
+
+def bench_evaluate_batch(rows=100000):
+    if numpy is None:
+        print('evaluate_batch: skipped, numpy is not installed')
+        return
+    expression = sample_expression()
+    xs = [random.uniform(1, 100) for _ in range(rows)]
+    ys = [random.uniform(1, 100) for _ in range(rows)]
+    x_column, y_column = numpy.array(xs), numpy.array(ys)
+
+    scalar = timeit.timeit(
+        lambda: [expression.evaluate(x=x, y=y) for x, y in zip(xs, ys)],
+        number=1)
+    batch = timeit.timeit(
+        lambda: expression.evaluate_batch(x=x_column, y=y_column), number=1)
+    custom = create_expression((create_variable('x'),
+                                create_operator('max', max),
+                                create_constant(50)))
+    fallback = timeit.timeit(lambda: custom.evaluate_batch(x=x_column),
+                             number=1)
+    shadowed = create_expression((create_variable('x'),
+                                  create_operator('+', lambda a, b: a * b),
+                                  create_constant(5)))
+    assert shadowed.evaluate_batch(x=numpy.array([3])).tolist() == \
+        [shadowed.evaluate(x=3)]
+    assert expression.evaluate_batch(x=x_column[:10], y=y_column[:10])\
+        .tolist() == [expression.evaluate(x=x, y=y)
+                      for x, y in zip(xs[:10], ys[:10])]
+    print('evaluate_batch ({} rows): scalar loop {:.3f}s, '
+          'batch {:.4f}s, custom operator fallback {:.3f}s'.format(
+              rows, scalar, batch, fallback))
+
+
+def repeated_terms(terms=2000):
+    x = create_variable('x')
+    y = create_variable('y')
+    total = create_constant(0)
+    for i in range(terms):
+        total = total + (x * y + i % 10) * (x - y)
+    return total
+
+
+class Scaled:
+    def __init__(self, factor):
+        self.factor = factor
+
+    def apply(self, lhs, rhs):
+        return (lhs + rhs) * self.factor
+
+
+class Offset:
+    offset = 0
+
+    @classmethod
+    def apply(cls, lhs, rhs):
+        return lhs + rhs + cls.offset
+
+
+class Offset10(Offset):
+    offset = 10
+
+
+def method_expressions():
+    x = create_variable('x')
+    return [create_expression((x, create_operator('+', function),
+                               create_constant(1)))
+            for function in (Scaled(1).apply, Scaled(10).apply,
+                             Offset.apply, Offset10.apply)]
+
+
+def bench_interning(terms=2000):
+    interner = Interner()
+    expressions = method_expressions()
+    assert [interner.intern(expression).evaluate(x=1)
+            for expression in expressions] == \
+        [expression.evaluate(x=1) for expression in expressions]
+
+    expression = repeated_terms(terms)
+    interner = Interner()
+    shared = interner.intern(expression)
+    tree = timeit.timeit(lambda: expression.evaluate(x=3, y=2), number=10)
+    dag = timeit.timeit(lambda: shared.evaluate(x=3, y=2), number=10)
+    print('interning ({} terms): {} unique nodes, '
+          'tree evaluate {:.3f}s, dag evaluate {:.3f}s'.format(
+              terms, len(interner), tree, dag))
+
+
+def bench_simplify(terms=2000):
+    x = create_variable('x')
+    expression = create_constant(0)
+    for i in range(terms):
+        expression = expression + (x * (create_constant(i) * 2 -
+                                         create_constant(3) ** 2))
+    simplified, report = expression.simplify(report=True)
+    before = timeit.timeit(lambda: expression.evaluate(x=3), number=10)
+    after = timeit.timeit(lambda: simplified.evaluate(x=3), number=10)
+    print('simplify ({} terms): removed {} of {} nodes, '
+          'evaluate {:.3f}s -> {:.3f}s'.format(
+              terms, report['removed'], report['before'], before, after))
+
+
+def deep_chain(size):
+    return sum([create_variable('x')] * size)
+
+
+def balanced_tree(size):
+    level = [create_variable('x{}'.format(i % 16)) for i in range(size)]
+    while len(level) > 1:
+        paired = [level[i] + level[i + 1] for i in range(0, len(level) - 1, 2)]
+        level = paired + level[len(paired) * 2:]
+    return level[0]
+
+
+def bench_traversals(size=100000):
+    bindings = {'x{}'.format(i): i for i in range(16)}
+    bindings['x'] = 1
+    for shape, build in (('deep chain', deep_chain),
+                         ('balanced tree', balanced_tree)):
+        expression = build(size)
+        evaluate = timeit.timeit(lambda: expression.evaluate(**bindings),
+                                 number=1)
+        stringify = timeit.timeit(lambda: str(expression), number=1)
+        names = timeit.timeit(lambda: expression.variable_names, number=1)
+        print('{} ({} leaves): evaluate {:.3f}s, str {:.3f}s, '
+              'variable_names {:.3f}s'.format(shape, size, evaluate,
+                                              stringify, names))
+
+
+class DictConstant(Constant):
+    pass
+
+
+class DictVariable(Variable):
+    pass
+
+
+class DictOperator(Operator):
+    pass
+
+
+class DictExpression(Expression):
+    pass
+
+
+def dict_chain(size):
+    expression = DictVariable('x')
+    for i in range(size):
+        plus = DictOperator('+', lambda lhs, rhs: lhs + rhs)
+        expression = DictExpression((expression, plus, DictConstant(i)))
+    return expression
+
+
+def slotted_chain(size):
+    expression = create_variable('x')
+    for i in range(size):
+        expression = expression + create_constant(i)
+    return expression
+
+
+def traced_size(build):
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def bench_memory(size=100000):
+    expressions = method_expressions()
+    product = expressions[0] * expressions[1] * expressions[2] * \
+        expressions[3]
+    assert product.compact().evaluate(x=1) == product.evaluate(x=1)
+
+    _, dict_size = traced_size(lambda: dict_chain(size))
+    tree, slotted_size = traced_size(lambda: slotted_chain(size))
+    _, arena_size = traced_size(tree.compact)
+    print('memory ({} nodes): __dict__ classes {:.1f} MB, '
+          '__slots__ classes {:.1f} MB, arena {:.1f} MB'.format(
+              size, dict_size / 2 ** 20, slotted_size / 2 ** 20,
+              arena_size / 2 ** 20))
+
+
+def bench_incremental(size=4096, updates=200):
+    expression = balanced_tree(size)
+    names = ['x{}'.format(i) for i in range(16)]
+    bindings = {name: 1 for name in names}
+    context = EvaluationContext(expression, **bindings)
+    changes = [(random.choice(names), random.randint(0, 9))
+               for _ in range(updates)]
+
+    def full():
+        for name, value in changes:
+            bindings[name] = value
+            expression.evaluate(**bindings)
+
+    def incremental():
+        for name, value in changes:
+            context.update(**{name: value})
+
+    print('incremental ({} leaves, {} updates): full evaluate {:.3f}s, '
+          'context.update {:.3f}s'.format(size, updates,
+                                          timeit.timeit(full, number=1),
+                                          timeit.timeit(incremental,
+                                                        number=1)))
+
+
+def bench_cache(queries=2000, distinct=50):
+    cache = EvaluationCache()
+    expressions = method_expressions()
+    assert [cache.evaluate(expression, x=1)
+            for expression in expressions] == \
+        [expression.evaluate(x=1) for expression in expressions]
+
+    expression = repeated_terms(200)
+    requests = [{'x': random.randint(1, distinct), 'y': 3}
+                for _ in range(queries)]
+    cache = EvaluationCache(maxsize=distinct // 2)
+    plain = timeit.timeit(
+        lambda: [expression.evaluate(**request) for request in requests],
+        number=1)
+    cached = timeit.timeit(
+        lambda: [cache.evaluate(expression, **request)
+                 for request in requests], number=1)
+    print('cache ({} queries): plain {:.3f}s, cached {:.3f}s, '
+          '{} hits, {} misses, {} evictions'.format(
+              queries, plain, cached, cache.hits, cache.misses,
+              cache.evictions))
+
+
+def bench_evaluate_many(count=400, workers=4):
+    checks = method_expressions()
+    assert [result.value for result in evaluate_many(
+        checks, {'x': 1}, workers=workers)] == \
+        [expression.evaluate(x=1) for expression in checks]
+
+    expressions = [repeated_terms(200) for _ in range(count)]
+    bindings = {'x': 3, 'y': 2}
+    serial = timeit.timeit(
+        lambda: [expression.evaluate(**bindings)
+                 for expression in expressions], number=1)
+    parallel = timeit.timeit(
+        lambda: evaluate_many(expressions, bindings, workers=workers),
+        number=1)
+    print('evaluate_many ({} expressions): serial {:.3f}s, '
+          '{} workers {:.3f}s'.format(count, serial, workers, parallel))
+
+
+BENCHMARKS = [
+    bench_evaluate_batch,
+    bench_interning,
+    bench_simplify,
+    bench_traversals,
+    bench_memory,
+    bench_incremental,
+    bench_cache,
+    bench_evaluate_many
+]
+
+
+if __name__ == '__main__':
+    for benchmark in BENCHMARKS:
+        benchmark()
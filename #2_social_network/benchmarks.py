@@ -0,0 +1,454 @@
+import os
+import random
+import tempfile
+import timeit
+import tracemalloc
+
+from social_network import (User, SocialGraph, TimelineSocialGraph,
+                            ConcurrentSocialGraph, CachedSocialGraph,
+                            UserDoesNotExistError, MAX_POSTS, post_order,
+                            save_graph, load_graph, GraphStore)
+
+
+def random_graph(users, degree=10, seed=0, graph=None):
+    rng = random.Random(seed)
+    graph = SocialGraph() if graph is None else graph
+    uuids = []
+    for i in range(users):
+        user = User('user {}'.format(i))
+        graph.add_user(user)
+        uuids.append(user.uuid)
+    for follower in uuids:
+        for _ in range(degree):
+            graph.follow(follower, rng.choice(uuids))
+    return graph, uuids
+
+
+def bench_adjacency(sizes=(10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6), calls=1000):
+    for size in sizes:
+        graph, uuids = random_graph(size)
+        sample = random.sample(uuids, min(calls, size))
+        pairs = list(zip(sample, reversed(sample)))
+        follow = timeit.timeit(
+            lambda: [graph.follow(a, b) for a, b in pairs], number=1)
+        is_following = timeit.timeit(
+            lambda: [graph.is_following(a, b) for a, b in pairs], number=1)
+        followers = timeit.timeit(
+            lambda: [graph.followers(user) for user in sample], number=1)
+        unfollow = timeit.timeit(
+            lambda: [graph.unfollow(a, b) for a, b in pairs], number=1)
+        delete = timeit.timeit(
+            lambda: [graph.delete_user(user) for user in sample[:100]],
+            number=1)
+        print('{:>8} users: follow {:.4f}s, is_following {:.4f}s, '
+              'followers {:.4f}s, unfollow {:.4f}s, delete_user(100) '
+              '{:.4f}s'.format(size, follow, is_following, followers,
+                               unfollow, delete))
+
+
+def bench_traversals(sizes=(10 ** 4, 10 ** 5), queries=100):
+    for size in sizes:
+        graph, uuids = random_graph(size, degree=20)
+        pairs = [(random.choice(uuids), random.choice(uuids))
+                 for _ in range(queries)]
+        min_distance = timeit.timeit(
+            lambda: [graph.min_distance(a, b) for a, b in pairs], number=1)
+        max_distance = timeit.timeit(
+            lambda: [graph.max_distance(a) for a, _ in pairs[:10]], number=1)
+        layers = timeit.timeit(
+            lambda: [graph.nth_layer_followings(a, 2) for a, _ in pairs],
+            number=1)
+        print('{:>8} users, {} edges: min_distance {:.2f}ms/query, '
+              'max_distance {:.1f}ms/query, nth_layer_followings(2) '
+              '{:.2f}ms/query'.format(size, size * 20,
+                                      min_distance * 1000 / queries,
+                                      max_distance * 100, layers * 1000 /
+                                      queries))
+
+
+def posting_graph(followees, posts=MAX_POSTS):
+    graph, uuids = random_graph(followees + 1, degree=0)
+    reader = uuids[0]
+    for followee in uuids[1:]:
+        graph.follow(reader, followee)
+    for i in range(posts):
+        for followee in uuids[1:]:
+            graph.graph[followee].add_post('post {}'.format(i))
+    return graph, reader
+
+
+def sorted_feed(graph, user_uuid, offset=0, limit=10):
+    feed = []
+    for user in graph.graph[user_uuid].following:
+        feed.extend(graph.graph[user].posts)
+    feed.sort(key=post_order, reverse=True)
+    return feed[offset:offset + limit]
+
+
+def bench_feed(followees=(100, 1000, 5000), requests=20):
+    for count in followees:
+        graph, reader = posting_graph(count)
+        full_sort = timeit.timeit(
+            lambda: sorted_feed(graph, reader), number=requests)
+        merged = timeit.timeit(
+            lambda: graph.generate_feed(reader), number=requests)
+
+        def paginate():
+            cursor = None
+            for _ in range(5):
+                _, cursor = graph.generate_feed_page(reader, cursor)
+
+        pages = timeit.timeit(paginate, number=requests)
+        print('{:>5} followees: full sort {:.2f}ms, heap merge {:.2f}ms, '
+              '5 cursor pages {:.2f}ms'.format(
+                  count, full_sort * 1000 / requests,
+                  merged * 1000 / requests, pages * 1000 / requests))
+
+
+def bench_fan_out(users=2000, degree=100, posts=20000, reads=2000):
+    for name, graph in (
+            ('pull', SocialGraph()),
+            ('push', TimelineSocialGraph()),
+            ('hybrid', TimelineSocialGraph(fan_out_threshold=degree * 2))):
+        graph, uuids = random_graph(users, degree, graph=graph)
+        authors = [random.choice(uuids) for _ in range(posts)]
+        readers = [random.choice(uuids) for _ in range(reads)]
+        write = timeit.timeit(
+            lambda: [graph.add_post(author, 'post') for author in authors],
+            number=1)
+        read = timeit.timeit(
+            lambda: [graph.generate_feed(reader) for reader in readers],
+            number=1)
+        print('{:>6}: add_post {:.1f}us/post, generate_feed '
+              '{:.1f}us/read'.format(name, write * 10 ** 6 / posts,
+                                     read * 10 ** 6 / reads))
+
+
+def bench_snapshot(sizes=(10 ** 4, 10 ** 5), degree=20, queries=50):
+    for size in sizes:
+        graph, uuids = random_graph(size, degree)
+        tracemalloc.start()
+        snapshot = graph.snapshot()
+        snapshot_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        pairs = [(random.choice(uuids), random.choice(uuids))
+                 for _ in range(queries)]
+        timings = []
+        for target in (graph, snapshot):
+            timings.append(timeit.timeit(
+                lambda: [target.min_distance(a, b) for a, b in pairs],
+                number=1) * 1000 / queries)
+            timings.append(timeit.timeit(
+                lambda: [target.max_distance(a) for a, _ in pairs[:5]],
+                number=1) * 1000 / 5)
+        print('{:>8} users, {} edges: snapshot {:.1f} MB; min_distance '
+              '{:.2f}ms -> {:.2f}ms, max_distance {:.1f}ms -> {:.1f}ms'.format(
+                  size, snapshot.edge_count, snapshot_size / 2 ** 20,
+                  timings[0], timings[2], timings[1], timings[3]))
+
+
+def assert_store_matches(store, graph):
+    assert set(store.users()) == set(graph.graph)
+    for user_uuid, user in graph.graph.items():
+        assert store.full_name(user_uuid) == user.full_name
+        assert store.following(user_uuid) == graph.following(user_uuid)
+        assert store.followers(user_uuid) == graph.followers(user_uuid)
+        assert store.posts(user_uuid) == [(post.published_at, post.content)
+                                          for post in user.posts]
+
+
+def check_store_round_trip(graph, uuids, path):
+    rng = random.Random(1)
+    save_graph(graph, path)
+    with GraphStore(path) as store:
+        assert_store_matches(store, graph)
+        for i in range(200):
+            follower, followee = rng.choice(uuids), rng.choice(uuids)
+            if i % 3:
+                store.follow(follower, followee)
+                graph.follow(follower, followee)
+            else:
+                store.unfollow(follower, followee)
+                graph.unfollow(follower, followee)
+        user = User('journaled user')
+        store.add_user(user)
+        graph.add_user(user)
+        store.follow(user.uuid, uuids[0])
+        graph.follow(user.uuid, uuids[0])
+        for author in (user.uuid, uuids[0]):
+            graph.add_post(author, 'journaled post by {}'.format(author))
+            store.add_post(author, graph.graph[author].posts[-1])
+        assert_store_matches(store, graph)
+
+    with open(path + '.journal', 'ab') as journal:
+        journal.write(b'P' + uuids[0].bytes + b'\x00\x01')
+    for _ in range(2):
+        with GraphStore(path) as store:
+            assert_store_matches(store, graph)
+    reloaded = load_graph(path)
+    for user_uuid in graph.graph:
+        assert reloaded.following(user_uuid) == graph.following(user_uuid)
+        assert reloaded.followers(user_uuid) == graph.followers(user_uuid)
+
+
+def bench_persistence(sizes=(10 ** 4, 10 ** 5), degree=20):
+    for size in sizes:
+        graph, uuids = random_graph(size, degree)
+        for user_uuid in uuids[:size // 10]:
+            graph.add_post(user_uuid, 'post by {}'.format(user_uuid))
+        path = os.path.join(tempfile.mkdtemp(), 'graph.bin')
+        if size == sizes[0]:
+            check_store_round_trip(graph, uuids, path + '.check')
+        save = timeit.timeit(lambda: save_graph(graph, path), number=1)
+        store = GraphStore(path)
+        opened = timeit.timeit(lambda: GraphStore(path).close(), number=1)
+        lookups = timeit.timeit(
+            lambda: [store.following(user) for user in uuids[:1000]],
+            number=1)
+        assert all(store.following(user) == graph.following(user)
+                   for user in uuids[:1000])
+        append = timeit.timeit(
+            lambda: [store.follow(random.choice(uuids), random.choice(uuids))
+                     for _ in range(1000)], number=1)
+        store.close()
+        loaded = timeit.timeit(lambda: load_graph(path), number=1)
+        print('{:>8} users: save {:.2f}s ({:.1f} MB), open {:.4f}s, '
+              '1000 following() {:.3f}s, 1000 appended follows {:.3f}s, '
+              'full load {:.2f}s'.format(size, save,
+                                         os.path.getsize(path) / 2 ** 20,
+                                         opened, lookups, append, loaded))
+
+
+def bench_concurrent(users=10000, edges=100000):
+    for name, graph in (('plain', SocialGraph()),
+                        ('striped', ConcurrentSocialGraph())):
+        graph, uuids = random_graph(users, 0, graph=graph)
+        pairs = [(random.choice(uuids), random.choice(uuids))
+                 for _ in range(edges)]
+        single = timeit.timeit(
+            lambda: [graph.follow(a, b) for a, b in pairs], number=1)
+        [graph.unfollow(a, b) for a, b in pairs]
+        if isinstance(graph, ConcurrentSocialGraph):
+            batched = timeit.timeit(
+                lambda: graph.apply(('follow', a, b) for a, b in pairs),
+                number=1)
+            print('{:>8}: {} follow() calls {:.3f}s, apply() batch '
+                  '{:.3f}s'.format(name, edges, single, batched))
+        else:
+            print('{:>8}: {} follow() calls {:.3f}s'.format(name, edges,
+                                                           single))
+
+
+def check_method_parity(users=200, operations=4000, seed=0):
+    rng = random.Random(seed)
+    graphs = [SocialGraph(),
+              TimelineSocialGraph(fan_out_threshold=3, timeline_size=20),
+              CachedSocialGraph(maxsize=500), ConcurrentSocialGraph()]
+
+    def apply(graph, mutation):
+        if isinstance(graph, ConcurrentSocialGraph):
+            graph.apply([mutation])
+        else:
+            getattr(graph, mutation[0])(*mutation[1:])
+
+    def add_user(name, following):
+        shared = User(name)
+        for graph in graphs:
+            user = User(name)
+            user.uuid = shared.uuid
+            user.following = set(following)
+            apply(graph, ('add_user', user))
+        return shared.uuid
+
+    uuids = [add_user('user {}'.format(i), ()) for i in range(users)]
+    for step in range(operations):
+        kind = rng.random()
+        if kind < 0.4:
+            mutation = ('follow', rng.choice(uuids), rng.choice(uuids))
+        elif kind < 0.6:
+            mutation = ('unfollow', rng.choice(uuids), rng.choice(uuids))
+        elif kind < 0.95:
+            mutation = ('add_post', rng.choice(uuids), 'post {}'.format(step))
+        else:
+            mutation = ('delete_user', uuids.pop(rng.randrange(len(uuids))))
+        for graph in graphs:
+            apply(graph, mutation)
+        if mutation[0] == 'delete_user':
+            uuids.append(add_user('user {}'.format(step),
+                                  rng.sample(uuids, 5)))
+        if step % 200 == 0:
+            for user_uuid in rng.sample(uuids, 20):
+                expected = None
+                for graph in graphs:
+                    result = (graph.following(user_uuid),
+                              set(graph.followers(user_uuid)),
+                              set(graph.nth_layer_followings(user_uuid, 2)),
+                              graph.max_distance(user_uuid),
+                              [post.content for post
+                               in graph.generate_feed(user_uuid, 0, 15)])
+                    expected = expected or result
+                    assert result == expected, '{} diverged from {}'.format(
+                        type(graph).__name__, type(graphs[0]).__name__)
+
+
+def bench_methods(sizes=(10 ** 3, 10 ** 4, 10 ** 5), calls=200):
+    check_method_parity()
+    for size in sizes:
+        graph, uuids = random_graph(size)
+        for user_uuid in uuids:
+            graph.add_post(user_uuid, 'post')
+        sample = random.sample(uuids, calls)
+        pairs = list(zip(sample, reversed(sample)))
+        new_users = [User('new user') for _ in range(calls)]
+        methods = [
+            ('add_user', lambda: [graph.add_user(user)
+                                  for user in new_users]),
+            ('get_user', lambda: [graph.get_user(user) for user in sample]),
+            ('follow', lambda: [graph.follow(a, b) for a, b in pairs]),
+            ('unfollow', lambda: [graph.unfollow(a, b) for a, b in pairs]),
+            ('add_post', lambda: [graph.add_post(user, 'post')
+                                  for user in sample]),
+            ('is_following', lambda: [graph.is_following(a, b)
+                                      for a, b in pairs]),
+            ('followers', lambda: [graph.followers(user)
+                                   for user in sample]),
+            ('following', lambda: [graph.following(user)
+                                   for user in sample]),
+            ('friends', lambda: [graph.friends(user) for user in sample]),
+            ('min_distance', lambda: [graph.min_distance(a, b)
+                                      for a, b in pairs[:20]]),
+            ('max_distance', lambda: [graph.max_distance(user)
+                                      for user in sample[:2]]),
+            ('nth_layer_followings', lambda: [
+                graph.nth_layer_followings(user, 2) for user in sample]),
+            ('generate_feed', lambda: [graph.generate_feed(user)
+                                       for user in sample]),
+            ('generate_feed_page', lambda: [graph.generate_feed_page(user)
+                                            for user in sample]),
+            ('delete_user', lambda: [graph.delete_user(user.uuid)
+                                     for user in new_users]),
+        ]
+        checks = {
+            'follow': lambda: all(graph.is_following(a, b)
+                                  for a, b in pairs),
+            'unfollow': lambda: not any(graph.is_following(a, b)
+                                        for a, b in pairs),
+            'add_post': lambda: all(graph.graph[user].posts[-1].content ==
+                                    'post' for user in sample),
+            'followers': lambda: all(graph.followers(user) ==
+                                     graph._followers(user)
+                                     for user in sample),
+            'max_distance': lambda: all(graph.max_distance(user) ==
+                                        graph._max_distance(user)
+                                        for user in sample[:2]),
+            'nth_layer_followings': lambda: all(
+                graph.nth_layer_followings(user, 2) ==
+                graph._nth_layer_followings(user, 2) for user in sample),
+            'generate_feed': lambda: all(graph.generate_feed(user) ==
+                                         graph._generate_feed(user, 0, 10)
+                                         for user in sample),
+            'delete_user': lambda: not any(user.uuid in graph.graph
+                                           for user in new_users),
+        }
+        missing = User('missing').uuid
+        print('{} users:'.format(size))
+        for name, run in methods:
+            elapsed = timeit.timeit(run, number=1)
+            assert checks.get(name, lambda: True)(), \
+                '{} returned a wrong result'.format(name)
+            count = {'min_distance': 20, 'max_distance': 2}.get(name, calls)
+            print('    {:<22}{:>12.1f}us/call'.format(
+                name, elapsed * 10 ** 6 / count))
+        for name in ('get_user', 'delete_user', 'add_post', 'followers',
+                     'following', 'friends', 'max_distance',
+                     'generate_feed', 'generate_feed_page'):
+            try:
+                getattr(graph, name)(*[missing, 'post'][:1 + (
+                    name == 'add_post')])
+            except UserDoesNotExistError:
+                pass
+            else:
+                raise AssertionError('{} accepted a missing user'.format(
+                    name))
+
+
+def power_law_graph(users, degree=5, mutual=0.3, seed=0):
+    rng = random.Random(seed)
+    graph = SocialGraph()
+    uuids = []
+    endpoints = []
+    for i in range(users):
+        user = User('user {}'.format(i))
+        graph.add_user(user)
+        followees = {rng.choice(endpoints) for _ in range(degree)} \
+            if endpoints else set()
+        for followee in followees:
+            graph.follow(user.uuid, followee)
+            if rng.random() < mutual:
+                graph.follow(followee, user.uuid)
+            endpoints.append(followee)
+        uuids.append(user.uuid)
+        endpoints.append(user.uuid)
+    return graph, uuids
+
+
+def bench_batch_algorithms(sizes=(10 ** 3, 10 ** 4), sources=256):
+    for size in sizes:
+        graph, uuids = power_law_graph(size)
+        recommendations = timeit.timeit(graph.friend_recommendations,
+                                        number=1)
+        triangles = timeit.timeit(graph.triangle_counts, number=1)
+        sample = uuids[:sources]
+        separate = timeit.timeit(
+            lambda: [graph.max_distance(source) for source in sample],
+            number=1)
+        shared = timeit.timeit(
+            lambda: graph.distance_maps(sample), number=1)
+        parallel = timeit.timeit(
+            lambda: graph.distance_maps(sample, workers=4, chunksize=64),
+            number=1)
+        print('{:>7} users (power law): friend_recommendations {:.2f}s, '
+              'triangle_counts {:.2f}s, {} sources: per-source BFS '
+              '{:.2f}s, bitset distance_maps {:.2f}s, 4 workers '
+              '{:.2f}s'.format(size, recommendations, triangles, sources,
+                               separate, shared, parallel))
+
+
+def bench_cached(users=2000, queries=2000, dashboard=50, mutate_every=200):
+    for name, graph in (('plain', SocialGraph()),
+                        ('cached', CachedSocialGraph())):
+        graph, uuids = random_graph(users, 5, graph=graph)
+        watched = uuids[:dashboard]
+
+        def run():
+            for i in range(queries):
+                user = watched[i % dashboard]
+                graph.max_distance(user)
+                graph.followers(user)
+                if i % mutate_every == 0:
+                    graph.follow(random.choice(uuids), random.choice(uuids))
+
+        elapsed = timeit.timeit(run, number=1)
+        info = graph.cache_info() if name == 'cached' else {}
+        print('{:>7}: {} dashboard queries {:.2f}s{}'.format(
+            name, queries, elapsed,
+            ', hit rate {:.0%}'.format(info['hit_rate']) if info else ''))
+
+
+BENCHMARKS = [
+    bench_adjacency,
+    bench_traversals,
+    bench_feed,
+    bench_fan_out,
+    bench_snapshot,
+    bench_persistence,
+    bench_concurrent,
+    bench_methods,
+    bench_batch_algorithms,
+    bench_cached
+]
+
+
+if __name__ == '__main__':
+    for benchmark in BENCHMARKS:
+        benchmark()
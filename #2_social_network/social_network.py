@@ -1,6 +1,27 @@
+import os
+import mmap
 import uuid
+import struct
 import datetime
 import math
+import array
+import asyncio
+import functools
+import concurrent.futures
+import threading
+import contextlib
+import bisect
+import heapq
+import itertools
+import collections
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+MAX_POSTS = 50
 
 
 class UserDoesNotExistError(Exception):
@@ -19,31 +40,39 @@ class User:
     def __init__(self, full_name):
         self.full_name = full_name
         self.uuid = uuid.uuid4()
-        self.posts = []
-        self.following = []
+        self.posts = collections.deque(maxlen=MAX_POSTS)
+        self.following = set()
 
     def add_post(self, post_content):
         new_post = Post(self, post_content)
         self.posts.append(new_post)
-        if len(self.posts) > 50:
-            del self.posts[0]
 
     def get_post(self):
-        for i in range(len(self.posts)):
-            yield self.posts[i]
+        yield from self.posts
 
 
 class Post:
-    def __init__(self, author, content):
+    __slots__ = ('author', 'published_at', 'content', 'order')
+
+    sequence = itertools.count()
+
+    def __init__(self, author, content, published_at=None):
         self.author = author.uuid
-        self.published_at = datetime.datetime.now()
+        self.published_at = published_at or datetime.datetime.now()
         self.content = content
+        self.order = (self.published_at, next(Post.sequence))
+
+
+def post_order(post):
+    return post.order
 
 
 def user_exists(func):
+    @functools.wraps(func)
     def checked(self, *args):
+        graph = self.graph
         for arg in args:
-            if arg not in self.graph.keys():
+            if arg not in graph:
                 raise UserDoesNotExistError
         return func(self, *args)
     return checked
@@ -52,12 +81,21 @@ def user_exists(func):
 class SocialGraph:
     def __init__(self):
         self.graph = {}
+        self.reverse_graph = {}
+        self.version = 0
 
     def add_user(self, user):
-        if user.uuid in self.graph.keys():
+        if user.uuid in self.graph:
             raise UserAlreadyExistsError
-        else:
-            self.graph[user.uuid] = user
+        self._add_user(user)
+
+    def _add_user(self, user):
+        self.version += 1
+        self.graph[user.uuid] = user
+        self.reverse_graph[user.uuid] = set()
+        for followee in user.following:
+            if followee in self.reverse_graph:
+                self.reverse_graph[followee].add(user.uuid)
 
     @user_exists
     def get_user(self, user_uuid):
@@ -65,21 +103,45 @@ class SocialGraph:
 
     @user_exists
     def delete_user(self, user_uuid):
-        self.graph[user_uuid].following = []
-        for uuid, user in self.graph.items():
-            if user_uuid in user.following:
-                user.following.remove(user_uuid)
+        self._delete_user(user_uuid)
+
+    def _delete_user(self, user_uuid):
+        self.version += 1
+        for followee in self.graph[user_uuid].following:
+            self.reverse_graph[followee].discard(user_uuid)
+        for follower in self.reverse_graph[user_uuid]:
+            self.graph[follower].following.discard(user_uuid)
+        self.graph[user_uuid].following = set()
         del self.graph[user_uuid]
+        del self.reverse_graph[user_uuid]
 
     @user_exists
     def follow(self, follower, followee):
+        self._follow(follower, followee)
+
+    def _follow(self, follower, followee):
         if followee not in self.graph[follower].following:
-            self.graph[follower].following.append(followee)
+            self.version += 1
+            self.graph[follower].following.add(followee)
+            self.reverse_graph[followee].add(follower)
 
     @user_exists
     def unfollow(self, follower, followee):
+        self._unfollow(follower, followee)
+
+    def _unfollow(self, follower, followee):
         if followee in self.graph[follower].following:
-            self.graph[follower].following.remove(followee)
+            self.version += 1
+            self.graph[follower].following.discard(followee)
+            self.reverse_graph[followee].discard(follower)
+
+    def add_post(self, user_uuid, post_content):
+        if user_uuid not in self.graph:
+            raise UserDoesNotExistError
+        self._add_post(user_uuid, post_content)
+
+    def _add_post(self, user_uuid, post_content):
+        self.graph[user_uuid].add_post(post_content)
 
     @user_exists
     def is_following(self, follower, followee):
@@ -87,12 +149,10 @@ class SocialGraph:
 
     @user_exists
     def followers(self, user_uuid):
-        followers = set()
-        for uuid, user in self.graph.items():
-            if user_uuid in user.following:
-                followers.add(uuid)
+        return self._followers(user_uuid)
 
-        return followers
+    def _followers(self, user_uuid):
+        return set(self.reverse_graph[user_uuid])
 
     @user_exists
     def following(self, user_uuid):
@@ -100,79 +160,1065 @@ class SocialGraph:
 
     @user_exists
     def friends(self, user_uuid):
-        friends = set()
-        for followee in self.graph[user_uuid].following:
-            if self.is_following(followee, user_uuid):
-                friends.add(followee)
-
-        return friends
+        return self.graph[user_uuid].following & \
+            self.reverse_graph[user_uuid]
 
     @user_exists
     def min_distance(self, from_user_uuid, to_user_uuid):
         if from_user_uuid == to_user_uuid:
             return 0
-        level = 1
-        queue = self.graph[from_user_uuid].following
-        next_level = []
-        visited = [from_user_uuid]
-        while queue:
-            for followed in queue:
-                if followed == to_user_uuid:
-                    return level
-                else:
-                    for next_level_followed in self.graph[followed].following:
-                        if next_level_followed not in visited:
-                            next_level.append(next_level_followed)
-                    visited.append(followed)
-            level += 1
-            queue = next_level
-            next_level = []
+        forward = {from_user_uuid: 0}
+        backward = {to_user_uuid: 0}
+        forward_layer = [from_user_uuid]
+        backward_layer = [to_user_uuid]
+        while forward_layer and backward_layer:
+            if len(forward_layer) <= len(backward_layer):
+                forward_layer, distance = self._expand_layer(
+                    forward_layer, forward, backward,
+                    lambda user: self.graph[user].following)
+            else:
+                backward_layer, distance = self._expand_layer(
+                    backward_layer, backward, forward,
+                    self.reverse_graph.__getitem__)
+            if distance is not None:
+                return distance
         raise UsersNotConnectedError
 
+    @staticmethod
+    def _expand_layer(layer, distances, other_distances, neighbours):
+        next_layer = []
+        shortest = None
+        for user in layer:
+            next_distance = distances[user] + 1
+            for neighbour in neighbours(user):
+                if neighbour in other_distances:
+                    candidate = next_distance + other_distances[neighbour]
+                    if shortest is None or candidate < shortest:
+                        shortest = candidate
+                if neighbour not in distances:
+                    distances[neighbour] = next_distance
+                    next_layer.append(neighbour)
+        return next_layer, shortest
+
     @user_exists
     def max_distance(self, user_uuid):
+        return self._max_distance(user_uuid)
+
+    def _max_distance(self, user_uuid):
         if not self.graph[user_uuid].following:
             return math.inf
-        queue = [user_uuid]
-        visited = [user_uuid]
-        next_level = []
+        visited = {user_uuid}
+        layer = [user_uuid]
         max_distance = -1
-        while queue:
-            for user in queue:
-                for followed in self.graph[user].following:
-                    if followed not in visited:
-                        next_level.append(followed)
-                        visited.append(followed)
+        while layer:
+            next_layer = []
+            for user in layer:
+                for followed in self.graph[user].following - visited:
+                    visited.add(followed)
+                    next_layer.append(followed)
             max_distance += 1
-            queue = next_level
-            next_level = []
+            layer = next_layer
         return max_distance
 
     def nth_layer_followings(self, user_uuid, n):
-        if user_uuid not in self.graph.keys():
+        if user_uuid not in self.graph:
             raise UserDoesNotExistError
-        queue = []
-        next_level = self.graph[user_uuid].following
-        visited = [user_uuid]
+        return self._nth_layer_followings(user_uuid, n)
+
+    def _nth_layer_followings(self, user_uuid, n):
+        if n < 1:
+            return set()
+        layer = {user_uuid}
+        visited = {user_uuid}
         for i in range(n):
-            queue = next_level
-            next_level = []
-            for followed in queue:
-                for next_level_followed in self.graph[followed].following:
-                    if next_level_followed not in visited:
-                        next_level.append(next_level_followed)
-                visited.append(followed)
-        return set(queue)
+            layer = {followed for user in layer
+                     for followed in self.graph[user].following
+                     if followed not in visited}
+            visited |= layer
+        return layer
+
+    def snapshot(self):
+        return GraphSnapshot(self)
+
+    def _friend_sets(self):
+        return {user_uuid: (user.following & self.reverse_graph[user_uuid]) -
+                {user_uuid} for user_uuid, user in self.graph.items()}
+
+    def friend_recommendations(self, limit=10):
+        friends = self._friend_sets()
+        recommendations = {}
+        for user_uuid, user_friends in friends.items():
+            mutual = collections.Counter()
+            for friend in user_friends:
+                mutual.update(friends[friend])
+            for known in self.graph[user_uuid].following | {user_uuid}:
+                mutual.pop(known, None)
+            recommendations[user_uuid] = mutual.most_common(limit)
+        return recommendations
+
+    def triangle_counts(self):
+        friends = self._friend_sets()
+        rank = {user_uuid: (len(user_friends), index) for index, (
+            user_uuid, user_friends) in enumerate(friends.items())}
+        higher = {user_uuid: {friend for friend in user_friends
+                              if rank[friend] > rank[user_uuid]}
+                  for user_uuid, user_friends in friends.items()}
+        per_user = dict.fromkeys(self.graph, 0)
+        total = 0
+        for user_uuid, user_higher in higher.items():
+            for friend in user_higher:
+                for third in user_higher & higher[friend]:
+                    total += 1
+                    per_user[user_uuid] += 1
+                    per_user[friend] += 1
+                    per_user[third] += 1
+        return total, per_user
+
+    def distance_maps(self, sources=None, workers=1, chunksize=256):
+        snapshot = self.snapshot()
+        sources = list(self.graph if sources is None else sources)
+        for source in sources:
+            if source not in snapshot.ids:
+                raise UserDoesNotExistError
+        chunks = [[snapshot.ids[source] for source in sources[start:
+                                                              start +
+                                                              chunksize]]
+                  for start in range(0, len(sources), chunksize)]
+        if workers is not None and workers <= 1:
+            results = [bitset_distances(snapshot.offsets, snapshot.targets,
+                                        chunk) for chunk in chunks]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(
+                    workers, initializer=_share_adjacency,
+                    initargs=(snapshot.offsets,
+                              snapshot.targets)) as executor:
+                results = list(executor.map(_shared_bitset_distances,
+                                            chunks))
+        distance_maps = {}
+        for chunk, chunk_distances in zip(chunks, results):
+            for source, distances in zip(chunk, chunk_distances):
+                distance_maps[snapshot.uuids[source]] = {
+                    snapshot.uuids[user]: distance
+                    for user, distance in distances.items()}
+        return distance_maps
 
     def generate_feed(self, user_uuid, offset=0, limit=10):
-        if user_uuid not in self.graph.keys():
+        if user_uuid not in self.graph:
             raise UserDoesNotExistError
-        feed = []
-        for user in self.graph[user_uuid].following:
-            feed.extend(self.graph[user].posts)
-        feed.sort(key=lambda posts: posts.published_at, reverse=True)
-        if len(feed) < (limit - offset):
-            return feed[offset::]
+        return self._generate_feed(user_uuid, offset, limit)
+
+    def _generate_feed(self, user_uuid, offset, limit):
+        feed = heapq.merge(*(reversed(posts) for posts
+                             in self._followee_posts(user_uuid)),
+                           key=post_order, reverse=True)
+        return list(itertools.islice(feed, offset, offset + limit))
+
+    def generate_feed_page(self, user_uuid, cursor=None, limit=10):
+        if user_uuid not in self.graph:
+            raise UserDoesNotExistError
+        buffers = []
+        for posts in self._followee_posts(user_uuid):
+            older = len(posts) if cursor is None else \
+                bisect.bisect_left(posts, cursor, key=post_order)
+            buffers.append(itertools.islice(reversed(posts),
+                                            len(posts) - older, None))
+        feed = heapq.merge(*buffers, key=post_order, reverse=True)
+        page = list(itertools.islice(feed, limit))
+        next_cursor = post_order(page[-1]) \
+            if page and len(page) == limit else None
+        return page, next_cursor
+
+    def _followee_posts(self, user_uuid):
+        return [self.graph[user].posts
+                for user in self.graph[user_uuid].following]
+
+
+def bitset_distances(offsets, targets, sources):
+    offsets, targets = memoryview(offsets), memoryview(targets)
+    seen = [0] * (len(offsets) - 1)
+    frontier = {}
+    distances = []
+    for bit, source in enumerate(sources):
+        seen[source] |= 1 << bit
+        frontier[source] = frontier.get(source, 0) | 1 << bit
+        distances.append({source: 0})
+    depth = 0
+    while frontier:
+        depth += 1
+        next_frontier = {}
+        for user, mask in frontier.items():
+            for followed in targets[offsets[user]:offsets[user + 1]]:
+                reached = mask & ~seen[followed]
+                if reached:
+                    next_frontier[followed] = \
+                        next_frontier.get(followed, 0) | reached
+        for user, mask in next_frontier.items():
+            seen[user] |= mask
+            while mask:
+                lowest = mask & -mask
+                distances[lowest.bit_length() - 1][user] = depth
+                mask ^= lowest
+        frontier = next_frontier
+    return distances
+
+
+_shared_adjacency = None
+
+
+def _share_adjacency(offsets, targets):
+    global _shared_adjacency
+    _shared_adjacency = (offsets, targets)
+
+
+def _shared_bitset_distances(sources):
+    return bitset_distances(*_shared_adjacency, sources)
+
+
+class GraphSnapshot:
+    def __init__(self, social_graph):
+        self.uuids = list(social_graph.graph)
+        self.ids = {user_uuid: index
+                    for index, user_uuid in enumerate(self.uuids)}
+        self.offsets = array.array('q', [0])
+        self.targets = array.array('i')
+        for user_uuid in self.uuids:
+            self.targets.extend(self.ids[followed] for followed
+                                in social_graph.graph[user_uuid].following)
+            self.offsets.append(len(self.targets))
+        if numpy is not None:
+            self.offsets = numpy.frombuffer(self.offsets, dtype=numpy.int64)
+            self.targets = numpy.frombuffer(self.targets, dtype=numpy.int32)
+        self.reverse_offsets, self.reverse_targets = self._transpose()
+
+    def __len__(self):
+        return len(self.uuids)
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    def _transpose(self):
+        if numpy is not None:
+            counts = numpy.bincount(self.targets, minlength=len(self.uuids))
+            sources = numpy.repeat(
+                numpy.arange(len(self.uuids), dtype=numpy.int32),
+                numpy.diff(self.offsets))
+            order = numpy.argsort(self.targets, kind='stable')
+            return numpy.concatenate(([0], numpy.cumsum(counts))), \
+                sources[order]
+        counts = array.array('q', [0]) * (len(self.uuids) + 1)
+        for target in self.targets:
+            counts[target + 1] += 1
+        for index in range(len(self.uuids)):
+            counts[index + 1] += counts[index]
+        reverse_offsets = array.array('q', counts)
+        reverse_targets = array.array('i', [0]) * len(self.targets)
+        for source in range(len(self.uuids)):
+            for target in self.targets[self.offsets[source]:
+                                       self.offsets[source + 1]]:
+                reverse_targets[counts[target]] = source
+                counts[target] += 1
+        return reverse_offsets, reverse_targets
+
+    def _id(self, user_uuid):
+        if user_uuid not in self.ids:
+            raise UserDoesNotExistError
+        return self.ids[user_uuid]
+
+    def _uuids(self, ids):
+        return {self.uuids[index] for index in ids}
+
+    def following(self, user_uuid):
+        index = self._id(user_uuid)
+        return self._uuids(self.targets[self.offsets[index]:
+                                        self.offsets[index + 1]])
+
+    def followers(self, user_uuid):
+        index = self._id(user_uuid)
+        return self._uuids(self.reverse_targets[self.reverse_offsets[index]:
+                                                self.reverse_offsets[index +
+                                                                     1]])
+
+    def friends(self, user_uuid):
+        return self.following(user_uuid) & self.followers(user_uuid)
+
+    def min_distance(self, from_user_uuid, to_user_uuid):
+        source, target = self._id(from_user_uuid), self._id(to_user_uuid)
+        if source == target:
+            return 0
+        forward, backward = self._distances(), self._distances()
+        forward[source] = backward[target] = 0
+        forward_layer, backward_layer = self._layer([source]), \
+            self._layer([target])
+        depth = {True: 0, False: 0}
+        while len(forward_layer) and len(backward_layer):
+            is_forward = len(forward_layer) <= len(backward_layer)
+            if is_forward:
+                neighbours = _expand(forward_layer, self.offsets,
+                                     self.targets)
+                distances, others = forward, backward
+            else:
+                neighbours = _expand(backward_layer, self.reverse_offsets,
+                                     self.reverse_targets)
+                distances, others = backward, forward
+            depth[is_forward] += 1
+            shortest = _meeting_distance(neighbours, others)
+            if shortest is not None:
+                return depth[is_forward] + shortest
+            layer = _visit(neighbours, distances, depth[is_forward])
+            if is_forward:
+                forward_layer = layer
+            else:
+                backward_layer = layer
+        raise UsersNotConnectedError
+
+    def max_distance(self, user_uuid):
+        index = self._id(user_uuid)
+        if self.offsets[index] == self.offsets[index + 1]:
+            return math.inf
+        distances = self._distances()
+        distances[index] = 0
+        layer = self._layer([index])
+        max_distance = -1
+        while len(layer):
+            max_distance += 1
+            layer = _visit(_expand(layer, self.offsets, self.targets),
+                           distances, max_distance + 1)
+        return max_distance
+
+    def nth_layer_followings(self, user_uuid, n):
+        index = self._id(user_uuid)
+        if n < 1:
+            return set()
+        distances = self._distances()
+        distances[index] = 0
+        layer = self._layer([index])
+        for depth in range(1, n + 1):
+            layer = _visit(_expand(layer, self.offsets, self.targets),
+                           distances, depth)
+        return self._uuids(layer)
+
+    def _distances(self):
+        if numpy is not None:
+            return numpy.full(len(self.uuids), -1, dtype=numpy.int32)
+        return array.array('i', [-1]) * len(self.uuids)
+
+    @staticmethod
+    def _layer(ids):
+        if numpy is not None:
+            return numpy.array(ids, dtype=numpy.int32)
+        return ids
+
+
+def _expand(layer, offsets, targets):
+    if numpy is None:
+        return [target for index in layer
+                for target in targets[offsets[index]:offsets[index + 1]]]
+    starts = offsets[layer]
+    counts = offsets[layer + 1] - starts
+    total = int(counts.sum())
+    positions = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts)
+    return targets[positions + numpy.arange(total)]
+
+
+def _meeting_distance(neighbours, others):
+    if numpy is None:
+        met = [others[index] for index in neighbours if others[index] >= 0]
+        return min(met) if met else None
+    met = others[neighbours]
+    met = met[met >= 0]
+    return int(met.min()) if len(met) else None
+
+
+def _visit(neighbours, distances, depth):
+    if numpy is None:
+        layer = []
+        for index in neighbours:
+            if distances[index] < 0:
+                distances[index] = depth
+                layer.append(index)
+        return layer
+    layer = numpy.unique(neighbours[distances[neighbours] < 0])
+    distances[layer] = depth
+    return layer
+
+
+class TimelineSocialGraph(SocialGraph):
+    def __init__(self, fan_out_threshold=None, timeline_size=200):
+        super().__init__()
+        self.fan_out_threshold = fan_out_threshold
+        self.timeline_size = timeline_size
+        self.timelines = {}
+        self.timeline_floors = {}
+        self.pulled_followees = {}
+
+    def is_pushed(self, author_uuid):
+        return self.fan_out_threshold is None or \
+            len(self.reverse_graph[author_uuid]) <= self.fan_out_threshold
+
+    def _add_user(self, user):
+        was_pushed = {followee: self.is_pushed(followee)
+                      for followee in user.following & self.graph.keys()}
+        super()._add_user(user)
+        self.timelines[user.uuid] = collections.deque()
+        self.timeline_floors[user.uuid] = None
+        self.pulled_followees[user.uuid] = set()
+        for followee in user.following & self.graph.keys():
+            self._add_followee(user.uuid, followee)
+            if followee in was_pushed:
+                self._update_mode(followee, was_pushed[followee])
+
+    def _delete_user(self, user_uuid):
+        followers = set(self.reverse_graph[user_uuid])
+        followees = set(self.graph[user_uuid].following)
+        was_pushed = {followee: self.is_pushed(followee)
+                      for followee in followees}
+        super()._delete_user(user_uuid)
+        for follower in followers - {user_uuid}:
+            self._purge(follower, user_uuid)
+            self.pulled_followees[follower].discard(user_uuid)
+        for followee in followees - {user_uuid}:
+            self._update_mode(followee, was_pushed[followee])
+        del self.timelines[user_uuid]
+        del self.timeline_floors[user_uuid]
+        del self.pulled_followees[user_uuid]
+
+    def _follow(self, follower, followee):
+        if followee in self.graph[follower].following:
+            return
+        was_pushed = self.is_pushed(followee)
+        super()._follow(follower, followee)
+        self._add_followee(follower, followee)
+        self._update_mode(followee, was_pushed)
+
+    def _unfollow(self, follower, followee):
+        if followee not in self.graph[follower].following:
+            return
+        was_pushed = self.is_pushed(followee)
+        super()._unfollow(follower, followee)
+        self._purge(follower, followee)
+        self.pulled_followees[follower].discard(followee)
+        self._update_mode(followee, was_pushed)
+
+    def _add_post(self, user_uuid, post_content):
+        super()._add_post(user_uuid, post_content)
+        if self.is_pushed(user_uuid):
+            post = self.graph[user_uuid].posts[-1]
+            for follower in self.reverse_graph[user_uuid]:
+                self._push_newest(follower, post)
+
+    def _generate_feed(self, user_uuid, offset, limit):
+        floor = self.timeline_floors[user_uuid]
+        timeline = (post for post in self.timelines[user_uuid]
+                    if self._is_live(post))
+        feed = heapq.merge(timeline, *(
+            reversed(self.graph[author].posts)
+            for author in self.pulled_followees[user_uuid]),
+            key=post_order, reverse=True)
+        page = []
+        for post in itertools.islice(feed, offset + limit):
+            if floor is not None and post.order <= floor:
+                return super()._generate_feed(user_uuid, offset, limit)
+            page.append(post)
+        if floor is not None and len(page) < offset + limit:
+            return super()._generate_feed(user_uuid, offset, limit)
+        return page[offset:]
+
+    def _is_live(self, post):
+        author = self.graph.get(post.author)
+        return author is not None and post.order >= author.posts[0].order \
+            and self.is_pushed(post.author)
+
+    def _add_followee(self, follower, followee):
+        if self.is_pushed(followee):
+            self._push(follower, reversed(self.graph[followee].posts))
         else:
-            return feed[offset:(limit + offset)]
-        
\ No newline at end of file
+            self.pulled_followees[follower].add(followee)
+
+    def _update_mode(self, author_uuid, was_pushed):
+        if self.is_pushed(author_uuid) == was_pushed:
+            return
+        for follower in self.reverse_graph[author_uuid]:
+            if was_pushed:
+                self.pulled_followees[follower].add(author_uuid)
+            else:
+                self.pulled_followees[follower].discard(author_uuid)
+                self._purge(follower, author_uuid)
+                self._push(follower,
+                           reversed(self.graph[author_uuid].posts))
+
+    def _push_newest(self, user_uuid, post):
+        timeline = self.timelines[user_uuid]
+        if timeline and timeline[0].order > post.order:
+            self._push(user_uuid, [post])
+            return
+        timeline.appendleft(post)
+        if len(timeline) > self.timeline_size:
+            self._raise_floor(user_uuid, timeline.pop())
+
+    def _push(self, user_uuid, posts):
+        merged = heapq.merge(self.timelines[user_uuid], posts,
+                             key=post_order, reverse=True)
+        self.timelines[user_uuid] = collections.deque(
+            itertools.islice(merged, self.timeline_size))
+        dropped = next(merged, None)
+        if dropped is not None:
+            self._raise_floor(user_uuid, dropped)
+
+    def _raise_floor(self, user_uuid, dropped):
+        floor = self.timeline_floors[user_uuid]
+        if floor is None or floor < dropped.order:
+            self.timeline_floors[user_uuid] = dropped.order
+
+    def _purge(self, user_uuid, author_uuid):
+        self.timelines[user_uuid] = collections.deque(
+            post for post in self.timelines[user_uuid]
+            if post.author != author_uuid)
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+STORE_MAGIC = b'SGRAPH01'
+STORE_HEADER = struct.Struct('<8s3Q11Q')
+JOURNAL_USER = struct.Struct('<c16sI')
+JOURNAL_EDGE = struct.Struct('<c16s16s')
+JOURNAL_POST = struct.Struct('<c16sqI')
+
+
+def to_microseconds(moment):
+    return (moment - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def from_microseconds(microseconds):
+    return EPOCH + datetime.timedelta(microseconds=microseconds)
+
+
+def save_graph(social_graph, path):
+    uuids = sorted(social_graph.graph, key=lambda user_uuid: user_uuid.bytes)
+    ids = {user_uuid: index for index, user_uuid in enumerate(uuids)}
+    names = array.array('q', [0])
+    name_blob = bytearray()
+    offsets = array.array('q', [0])
+    targets = array.array('i')
+    reverse_offsets = array.array('q', [0])
+    reverse_targets = array.array('i')
+    post_offsets = array.array('q', [0])
+    post_times = array.array('q')
+    content_offsets = array.array('q', [0])
+    content_blob = bytearray()
+    for user_uuid in uuids:
+        user = social_graph.graph[user_uuid]
+        name_blob += user.full_name.encode('utf-8')
+        names.append(len(name_blob))
+        targets.extend(sorted(ids[followed] for followed in user.following))
+        offsets.append(len(targets))
+        reverse_targets.extend(sorted(
+            ids[follower] for follower in social_graph.reverse_graph[
+                user_uuid]))
+        reverse_offsets.append(len(reverse_targets))
+        for post in user.posts:
+            post_times.append(to_microseconds(post.published_at))
+            content_blob += post.content.encode('utf-8')
+            content_offsets.append(len(content_blob))
+        post_offsets.append(len(post_times))
+
+    sections = [b''.join(user_uuid.bytes for user_uuid in uuids), names,
+                name_blob, offsets, targets, reverse_offsets,
+                reverse_targets, post_offsets, post_times, content_offsets,
+                content_blob]
+    with open(path, 'wb') as store:
+        store.write(bytes(STORE_HEADER.size))
+        positions = []
+        for section in sections:
+            store.write(bytes(-store.tell() % 8))
+            positions.append(store.tell())
+            store.write(section)
+        store.seek(0)
+        store.write(STORE_HEADER.pack(STORE_MAGIC, len(uuids), len(targets),
+                                      len(post_times), *positions))
+    with open(path + '.journal', 'wb'):
+        pass
+
+
+def load_graph(path):
+    with GraphStore(path) as store:
+        return store.to_social_graph()
+
+
+class GraphStore:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = STORE_HEADER.unpack_from(self.map)
+        if header[0] != STORE_MAGIC:
+            raise ValueError('{} is not a social graph store'.format(path))
+        self.user_count, self.edge_count, self.post_count = header[1:4]
+        view = memoryview(self.map)
+        sizes = [16 * self.user_count, 8 * (self.user_count + 1), None,
+                 8 * (self.user_count + 1), 4 * self.edge_count,
+                 8 * (self.user_count + 1), 4 * self.edge_count,
+                 8 * (self.user_count + 1), 8 * self.post_count,
+                 8 * (self.post_count + 1), None]
+        ends = list(header[5:]) + [len(self.map)]
+        sections = [view[start:start + size if size is not None else end]
+                    for start, size, end in zip(header[4:], sizes, ends)]
+        self.uuid_bytes = sections[0]
+        self.names, self.offsets, self.reverse_offsets, \
+            self.post_offsets, self.post_times, self.content_offsets = (
+                sections[index].cast('q') for index in (1, 3, 5, 7, 8, 9))
+        self.targets = sections[4].cast('i')
+        self.reverse_targets = sections[6].cast('i')
+        self.name_blob = sections[2]
+        self.content_blob = sections[10]
+
+        self.added_users = {}
+        self.added_following = collections.defaultdict(set)
+        self.added_followers = collections.defaultdict(set)
+        self.removed_following = collections.defaultdict(set)
+        self.removed_followers = collections.defaultdict(set)
+        self.added_posts = collections.defaultdict(list)
+        self._replay_journal()
+        self.journal = open(path + '.journal', 'ab')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.journal.close()
+        self.uuid_bytes = self.names = self.offsets = self.targets = None
+        self.reverse_offsets = self.reverse_targets = None
+        self.post_offsets = self.post_times = self.content_offsets = None
+        self.name_blob = self.content_blob = None
+        self.map.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.user_count + len(self.added_users)
+
+    def __contains__(self, user_uuid):
+        return user_uuid in self.added_users or \
+            self._id(user_uuid) is not None
+
+    def users(self):
+        for index in range(self.user_count):
+            yield self._uuid(index)
+        yield from self.added_users
+
+    def full_name(self, user_uuid):
+        if user_uuid in self.added_users:
+            return self.added_users[user_uuid]
+        index = self._checked_id(user_uuid)
+        return str(self.name_blob[self.names[index]:self.names[index + 1]],
+                   'utf-8')
+
+    def following(self, user_uuid):
+        return self._adjacent(user_uuid, self.offsets, self.targets,
+                              self.added_following, self.removed_following)
+
+    def followers(self, user_uuid):
+        return self._adjacent(user_uuid, self.reverse_offsets,
+                              self.reverse_targets, self.added_followers,
+                              self.removed_followers)
+
+    def posts(self, user_uuid):
+        posts = []
+        if user_uuid not in self.added_users:
+            index = self._checked_id(user_uuid)
+            for post in range(self.post_offsets[index],
+                              self.post_offsets[index + 1]):
+                content = self.content_blob[self.content_offsets[post]:
+                                            self.content_offsets[post + 1]]
+                posts.append((from_microseconds(self.post_times[post]),
+                              str(content, 'utf-8')))
+        return posts + self.added_posts[user_uuid]
+
+    def add_user(self, user):
+        if user.uuid in self:
+            raise UserAlreadyExistsError
+        name = user.full_name.encode('utf-8')
+        self._append(JOURNAL_USER, (b'U', user.uuid.bytes, len(name)), name)
+
+    def follow(self, follower, followee):
+        self._check_users(follower, followee)
+        if followee not in self.following(follower):
+            self._append(JOURNAL_EDGE, (b'F', follower.bytes, followee.bytes))
+
+    def unfollow(self, follower, followee):
+        self._check_users(follower, followee)
+        if followee in self.following(follower):
+            self._append(JOURNAL_EDGE, (b'X', follower.bytes, followee.bytes))
+
+    def add_post(self, user_uuid, post):
+        self._check_users(user_uuid)
+        content = post.content.encode('utf-8')
+        self._append(JOURNAL_POST, (b'P', user_uuid.bytes,
+                                    to_microseconds(post.published_at),
+                                    len(content)), content)
+
+    def to_social_graph(self):
+        social_graph = SocialGraph()
+        uuids = list(self.users())
+        for user_uuid in uuids:
+            user = User(self.full_name(user_uuid))
+            user.uuid = user_uuid
+            social_graph.add_user(user)
+        for index, user_uuid in enumerate(uuids[:self.user_count]):
+            social_graph.graph[user_uuid].following = {
+                uuids[target] for target in
+                self.targets[self.offsets[index]:self.offsets[index + 1]]}
+            social_graph.reverse_graph[user_uuid] = {
+                uuids[source] for source in self.reverse_targets[
+                    self.reverse_offsets[index]:
+                    self.reverse_offsets[index + 1]]}
+        for user_uuid in uuids:
+            social_graph.graph[user_uuid].following |= \
+                self.added_following[user_uuid]
+            social_graph.graph[user_uuid].following -= \
+                self.removed_following[user_uuid]
+            social_graph.reverse_graph[user_uuid] |= \
+                self.added_followers[user_uuid]
+            social_graph.reverse_graph[user_uuid] -= \
+                self.removed_followers[user_uuid]
+        posts = []
+        for user_uuid in uuids:
+            posts.extend((published_at, user_uuid.bytes, content)
+                         for published_at, content in self.posts(user_uuid))
+        for published_at, author, content in sorted(
+                posts, key=lambda post: post[:2]):
+            user = social_graph.graph[uuid.UUID(bytes=author)]
+            user.posts.append(Post(user, content, published_at))
+        return social_graph
+
+    def _id(self, user_uuid):
+        key = user_uuid.bytes
+        low, high = 0, self.user_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.uuid_bytes[16 * middle:16 * middle + 16].tobytes() < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.user_count and \
+                self.uuid_bytes[16 * low:16 * low + 16] == key:
+            return low
+        return None
+
+    def _checked_id(self, user_uuid):
+        index = self._id(user_uuid)
+        if index is None:
+            raise UserDoesNotExistError
+        return index
+
+    def _check_users(self, *user_uuids):
+        for user_uuid in user_uuids:
+            if user_uuid not in self:
+                raise UserDoesNotExistError
+
+    def _uuid(self, index):
+        return uuid.UUID(bytes=bytes(self.uuid_bytes[16 * index:
+                                                     16 * index + 16]))
+
+    def _adjacent(self, user_uuid, offsets, targets, added, removed):
+        adjacent = set()
+        if user_uuid not in self.added_users:
+            index = self._checked_id(user_uuid)
+            adjacent = {self._uuid(target) for target in
+                        targets[offsets[index]:offsets[index + 1]]}
+        return (adjacent | added[user_uuid]) - removed[user_uuid]
+
+    def _append(self, record, fields, payload=b''):
+        entry = record.pack(*fields) + payload
+        self.journal.write(entry)
+        self.journal.flush()
+        self._apply(record, fields, payload)
+
+    def _apply(self, record, fields, payload):
+        kind, user_uuid = fields[0], uuid.UUID(bytes=fields[1])
+        if kind == b'U':
+            self.added_users[user_uuid] = str(payload, 'utf-8')
+        elif kind == b'P':
+            self.added_posts[user_uuid].append(
+                (from_microseconds(fields[2]), str(payload, 'utf-8')))
+        else:
+            other = uuid.UUID(bytes=fields[2])
+            added, removed = (self.added_following, self.removed_following) \
+                if kind == b'F' else (self.removed_following,
+                                      self.added_following)
+            added[user_uuid].add(other)
+            removed[user_uuid].discard(other)
+            added, removed = (self.added_followers, self.removed_followers) \
+                if kind == b'F' else (self.removed_followers,
+                                      self.added_followers)
+            added[other].add(user_uuid)
+            removed[other].discard(user_uuid)
+
+    def _replay_journal(self):
+        records = {b'U': JOURNAL_USER, b'F': JOURNAL_EDGE,
+                   b'X': JOURNAL_EDGE, b'P': JOURNAL_POST}
+        if not os.path.exists(self.path + '.journal'):
+            return
+        with open(self.path + '.journal', 'rb') as journal:
+            data = journal.read()
+        position = 0
+        while position < len(data):
+            record = records.get(data[position:position + 1])
+            if record is None or position + record.size > len(data):
+                break
+            fields = record.unpack_from(data, position)
+            length = fields[-1] if record is not JOURNAL_EDGE else 0
+            if position + record.size + length > len(data):
+                break
+            self._apply(record, fields,
+                        data[position + record.size:
+                             position + record.size + length])
+            position += record.size + length
+        if position < len(data):
+            os.truncate(self.path + '.journal', position)
+
+
+class ConcurrentSocialGraph(SocialGraph):
+    def __init__(self, stripes=64):
+        super().__init__()
+        self.locks = [threading.RLock() for _ in range(stripes)]
+
+    def _stripes(self, *user_uuids):
+        return sorted({hash(user_uuid) % len(self.locks)
+                       for user_uuid in user_uuids})
+
+    @contextlib.contextmanager
+    def _locked(self, *user_uuids):
+        with contextlib.ExitStack() as stack:
+            for stripe in self._stripes(*user_uuids):
+                stack.enter_context(self.locks[stripe])
+            yield
+
+    @contextlib.contextmanager
+    def _locked_all(self):
+        with contextlib.ExitStack() as stack:
+            for lock in self.locks:
+                stack.enter_context(lock)
+            yield
+
+    def add_user(self, user):
+        with self._locked(user.uuid):
+            super().add_user(user)
+
+    def delete_user(self, user_uuid):
+        with self._locked_all():
+            super().delete_user(user_uuid)
+
+    def follow(self, follower, followee):
+        with self._locked(follower, followee):
+            super().follow(follower, followee)
+
+    def unfollow(self, follower, followee):
+        with self._locked(follower, followee):
+            super().unfollow(follower, followee)
+
+    def add_post(self, user_uuid, post_content):
+        with self._locked(user_uuid):
+            super().add_post(user_uuid, post_content)
+
+    def is_following(self, follower, followee):
+        with self._locked(follower):
+            return super().is_following(follower, followee)
+
+    def followers(self, user_uuid):
+        with self._locked(user_uuid):
+            return super().followers(user_uuid)
+
+    def following(self, user_uuid):
+        with self._locked(user_uuid):
+            return super().following(user_uuid)
+
+    def friends(self, user_uuid):
+        with self._locked(user_uuid):
+            return super().friends(user_uuid)
+
+    def min_distance(self, from_user_uuid, to_user_uuid):
+        with self._locked_all():
+            return super().min_distance(from_user_uuid, to_user_uuid)
+
+    def max_distance(self, user_uuid):
+        with self._locked_all():
+            return super().max_distance(user_uuid)
+
+    def nth_layer_followings(self, user_uuid, n):
+        with self._locked_all():
+            return super().nth_layer_followings(user_uuid, n)
+
+    def snapshot(self):
+        with self._locked_all():
+            return super().snapshot()
+
+    def friend_recommendations(self, limit=10):
+        with self._locked_all():
+            return super().friend_recommendations(limit)
+
+    def triangle_counts(self):
+        with self._locked_all():
+            return super().triangle_counts()
+
+    def distance_maps(self, sources=None, workers=1, chunksize=256):
+        with self._locked_all():
+            return super().distance_maps(sources, workers, chunksize)
+
+    def _followee_posts(self, user_uuid):
+        with self._locked(user_uuid):
+            if user_uuid not in self.graph:
+                raise UserDoesNotExistError
+            followees = list(self.graph[user_uuid].following)
+        buffers = []
+        for followee in followees:
+            with self._locked(followee):
+                if followee in self.graph:
+                    buffers.append(list(self.graph[followee].posts))
+        return buffers
+
+    def apply(self, mutations):
+        mutations = list(mutations)
+        with self._locked_all():
+            self._validate(mutations)
+            for mutation in mutations:
+                getattr(self, '_' + mutation[0])(*mutation[1:])
+
+    def _validate(self, mutations):
+        added, deleted = set(), set()
+
+        def exists(user_uuid):
+            return (user_uuid in self.graph or user_uuid in added) and \
+                user_uuid not in deleted
+
+        for mutation in mutations:
+            kind, args = mutation[0], mutation[1:]
+            if kind not in BATCH_MUTATIONS:
+                raise ValueError('unsupported mutation {!r}'.format(kind))
+            arity, checked = BATCH_MUTATIONS[kind]
+            if len(args) != arity:
+                raise TypeError('{} takes {} arguments but {} were given'
+                                .format(kind, arity, len(args)))
+            if kind == 'add_user':
+                if exists(args[0].uuid):
+                    raise UserAlreadyExistsError
+                added.add(args[0].uuid)
+                deleted.discard(args[0].uuid)
+                continue
+            for user_uuid in args[:checked]:
+                if not exists(user_uuid):
+                    raise UserDoesNotExistError
+            if kind == 'delete_user':
+                deleted.add(args[0])
+
+    async def follow_async(self, follower, followee):
+        return await self._run_async(self.follow, follower, followee)
+
+    async def unfollow_async(self, follower, followee):
+        return await self._run_async(self.unfollow, follower, followee)
+
+    async def add_post_async(self, user_uuid, post_content):
+        return await self._run_async(self.add_post, user_uuid, post_content)
+
+    async def generate_feed_async(self, user_uuid, offset=0, limit=10):
+        return await self._run_async(self.generate_feed, user_uuid, offset,
+                                     limit)
+
+    async def apply_async(self, mutations):
+        return await self._run_async(self.apply, list(mutations))
+
+    @staticmethod
+    async def _run_async(method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(method,
+                                                                  *args))
+
+
+BATCH_MUTATIONS = {
+    'add_user': (1, 0),
+    'delete_user': (1, 1),
+    'follow': (2, 2),
+    'unfollow': (2, 2),
+    'add_post': (2, 1)
+}
+
+
+class CachedSocialGraph(SocialGraph):
+    def __init__(self, maxsize=100000):
+        super().__init__()
+        self.maxsize = maxsize
+        self.cache = collections.OrderedDict()
+        self.cache_weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def cache_info(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(self.cache),
+                'weight': self.cache_weight,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def clear_cache(self):
+        self.cache.clear()
+        self.cache_weight = 0
+
+    def _add_user(self, user):
+        super()._add_user(user)
+        for followee in user.following:
+            self._invalidate(('followers', followee))
+
+    def _delete_user(self, user_uuid):
+        followees = set(self.graph[user_uuid].following)
+        super()._delete_user(user_uuid)
+        for followee in followees | {user_uuid}:
+            self._invalidate(('followers', followee))
+
+    def _follow(self, follower, followee):
+        super()._follow(follower, followee)
+        self._invalidate(('followers', followee))
+
+    def _unfollow(self, follower, followee):
+        super()._unfollow(follower, followee)
+        self._invalidate(('followers', followee))
+
+    def _followers(self, user_uuid):
+        return self._cached(('followers', user_uuid), None, lambda: frozenset(
+            super(CachedSocialGraph, self)._followers(user_uuid)))
+
+    def _max_distance(self, user_uuid):
+        return self._cached(('max_distance', user_uuid), self.version,
+                            lambda: super(CachedSocialGraph,
+                                          self)._max_distance(user_uuid))
+
+    def _nth_layer_followings(self, user_uuid, n):
+        return self._cached(('nth_layer_followings', user_uuid, n),
+                            self.version, lambda: frozenset(
+                                super(CachedSocialGraph,
+                                      self)._nth_layer_followings(
+                                    user_uuid, n)))
+
+    def _cached(self, key, version, compute):
+        entry = self.cache.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return entry[1]
+        self.misses += 1
+        value = compute()
+        self._invalidate(key)
+        weight = 1 + (len(value) if isinstance(value, frozenset) else 0)
+        self.cache[key] = (version, value, weight)
+        self.cache_weight += weight
+        while self.cache_weight > self.maxsize and self.cache:
+            _, (_, _, evicted) = self.cache.popitem(last=False)
+            self.cache_weight -= evicted
+            self.evictions += 1
+        return value
+
+    def _invalidate(self, key):
+        entry = self.cache.pop(key, None)
+        if entry is not None:
+            self.cache_weight -= entry[2]
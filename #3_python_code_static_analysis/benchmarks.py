@@ -0,0 +1,441 @@
+import os
+import re
+import ast
+import glob
+import time
+import random
+import timeit
+import tempfile
+import tracemalloc
+from collections import Counter
+
+from python_code_static_analysis import (RULES as RULE_CLASSES, Errors,
+                                         CriticProfile, CriticRunner,
+                                         IncrementalCritic, critic_profile,
+                                         critic, critic_file, iter_lines)
+
+RULES = {
+    "max_nesting": 3,
+    "methods_per_class": 10,
+    "max_arity": 5,
+    "max_lines_per_function": 30
+}
+STRICT_RULES = {
+    "line_length": 40,
+    "forbid_semicolons": False,
+    "max_nesting": 0,
+    "indentation_size": 2,
+    "methods_per_class": 0,
+    "max_arity": 0,
+    "forbid_trailing_whitespace": False,
+    "max_lines_per_function": 1
+}
+
+
+def stdlib_sources(limit=200):
+    sources = []
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.__file__),
+                                              '*.py'))):
+        with open(path, encoding='utf-8') as source:
+            code = source.read()
+        try:
+            ast.parse(code)
+        except SyntaxError:
+            continue
+        sources.append(code)
+        if len(sources) == limit:
+            break
+    return sources
+
+
+class LegacyErrors:
+    def __init__(self):
+        self.errors = {}
+        self.critic_rules = {
+            "line_length": 79,
+            "forbid_semicolons": True,
+            "max_nesting": None,
+            "indentation_size": 4,
+            "methods_per_class": None,
+            "max_arity": None,
+            "forbid_trailing_whitespace": True,
+            "max_lines_per_function": None
+        }
+        self.lines_with_multiple_expressions = {}
+
+    def append_errors(self, new_errors):
+        for line, errors in new_errors.items():
+            if line in self.errors:
+                self.errors[line] += errors
+            else:
+                self.errors[line] = errors
+
+    def check_line_length(self, code):
+        error_message = "line too long ({} > {})"
+        max_length = self.critic_rules['line_length']
+        line_length_errors = {}
+        for line in range(len(code)):
+            line_length = len(code[line])
+            if line_length > max_length:
+                line_length_errors[line + 1] = [
+                    error_message.format(line_length, max_length)]
+
+        if line_length_errors:
+            self.append_errors(line_length_errors)
+
+    def check_trailing_whitespace(self, code):
+        if not self.critic_rules["forbid_trailing_whitespace"]:
+            return
+        error_message = 'trailing whitespace'
+        whitespace_errors = {}
+        for line in range(len(code)):
+            if re.search(r'\s$', code[line]):
+                whitespace_errors[line + 1] = [error_message]
+
+        if whitespace_errors:
+            self.append_errors(whitespace_errors)
+
+    def check_methods_per_class(self, tree):
+        if self.critic_rules['methods_per_class'] is None:
+            return
+        error_message = 'too many methods in class({} > {})'
+        max_methods = self.critic_rules['methods_per_class']
+        methods_per_class_errors = {}
+        methods_counter = 0
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ClassDef):
+                for child in ast.iter_child_nodes(node):
+                    if isinstance(child, ast.FunctionDef):
+                        methods_counter += 1
+                if methods_counter > max_methods:
+                    methods_per_class_errors[node.lineno] = \
+                        [error_message.format(methods_counter, max_methods)]
+                methods_counter = 0
+
+        if methods_per_class_errors:
+            self.append_errors(methods_per_class_errors)
+
+    def check_number_of_arguments(self, tree):
+        if self.critic_rules["max_arity"] is None:
+            return
+
+        error_message = "too many arguments({} > {})"
+        max_arg = self.critic_rules["max_arity"]
+        number_of_arguments_errors = {}
+
+        functions = [f for f in ast.walk(tree) if
+                     isinstance(f, ast.FunctionDef)]
+        for func in functions:
+            args_counter = len(func.args.args) + bool(func.args.vararg) + bool(
+                func.args.kwarg)
+            if args_counter > max_arg:
+                number_of_arguments_errors[func.lineno] = \
+                    [error_message.format(args_counter, max_arg)]
+
+        if number_of_arguments_errors:
+            self.append_errors(number_of_arguments_errors)
+
+    def check_function_lines(self, tree):
+        if not self.critic_rules["max_lines_per_function"]:
+            return
+
+        functions = [node for node in ast.walk(tree)
+                     if isinstance(node, ast.FunctionDef)]
+        error_message = 'method with too many lines ({} > {})'
+        lines_per_function_errors = {}
+
+        for func in functions:
+            current_level = [func]
+            lines = []
+            next_level = []
+            while current_level:
+                for node in current_level:
+                    next_level += [n for n in ast.iter_child_nodes(node)
+                                   if not isinstance(n, ast.arguments)]
+                current_lines = [n.lineno for n in current_level
+                                 if hasattr(n, "lineno")]
+                lines += current_lines
+                current_level = next_level
+                next_level = []
+
+            lines_count = len(set(lines))-1
+            if self.lines_with_multiple_expressions:
+                for line, occurrences in \
+                        self.lines_with_multiple_expressions.items():
+                    lines_count += \
+                        (self.lines_with_multiple_expressions[line]-1)
+            if lines_count > self.critic_rules["max_lines_per_function"]:
+                lines_per_function_errors[func.lineno] = \
+                    [error_message.format(lines_count,
+                     self.critic_rules["max_lines_per_function"])]
+
+        if lines_per_function_errors:
+            self.append_errors(lines_per_function_errors)
+
+    @staticmethod
+    def is_nested(node):
+        types = [ast.FunctionDef, ast.ClassDef, ast.If, ast.For, ast.While,
+                 ast.FunctionDef, ast.Try, ast.With]
+        return type(node) in types
+
+    def check_nesting(self, tree, nesting_counter=0):
+        if self.critic_rules["max_nesting"] is None:
+            return
+
+        error_message = 'nesting too deep ({} > {})'
+        nesting_errors = {}
+        if nesting_counter > self.critic_rules["max_nesting"]:
+            nesting_errors[(tree.lineno + 1)] = \
+                [error_message.format
+                 (nesting_counter, self.critic_rules["max_nesting"])]
+
+        if nesting_errors:
+            self.append_errors(nesting_errors)
+
+        for node in ast.iter_child_nodes(tree):
+            if self.is_nested(node):
+                self.check_nesting(node, (nesting_counter + 1))
+
+    @staticmethod
+    def is_logical(node):
+        types = [ast.Expr, ast.Return, ast.Assign]
+        return type(node) in types
+
+    def check_indentation(self, tree, expected_indentation=0):
+        error_message = 'indentation is {} instead of {}'
+        indentation_errors = {}
+        nodes = [node for node in ast.iter_child_nodes(tree)
+                 if self.is_nested(node) or self.is_logical(node)]
+        checked_lines = set()
+
+        for node in nodes:
+            if node.col_offset != expected_indentation \
+                    and node.lineno not in checked_lines:
+                indentation_errors[node.lineno] = \
+                    [error_message.format(node.col_offset,
+                                          expected_indentation)]
+            if hasattr(node, 'lineno'):
+                    checked_lines.add(node.lineno)
+
+        if indentation_errors:
+            self.append_errors(indentation_errors)
+        for node in ast.iter_child_nodes(tree):
+            if self.is_nested(node):
+                self.check_indentation(node,
+                                       (expected_indentation +
+                                        self.critic_rules["indentation_size"]))
+
+    def check_semicolons(self, tree):
+        error_message = 'multiple expressions on the same line'
+        semicolon_errors = {}
+        line_numbers = []
+
+        for node in ast.walk(tree):
+            if self.is_logical(node):
+                line_numbers.append(node.lineno)
+
+        if len(line_numbers) != len(set(line_numbers)):
+            line_occurrences = Counter(line_numbers)
+            self.lines_with_multiple_expressions = \
+                {line: occurrences for line, occurrences
+                 in line_occurrences.items() if occurrences > 1}
+            for line, occurrences in \
+                    self.lines_with_multiple_expressions.items():
+                semicolon_errors[line] = [error_message]
+        if semicolon_errors and self.critic_rules["forbid_semicolons"]:
+            self.append_errors(semicolon_errors)
+
+
+def legacy_critic(code, **rules):
+    result_errors = LegacyErrors()
+    result_errors.critic_rules.update(rules)
+    split_code = code.split(sep="\n")
+    tree = ast.parse(code, mode="exec")
+
+    result_errors.check_line_length(split_code)
+    result_errors.check_trailing_whitespace(split_code)
+    result_errors.check_semicolons(tree)
+    result_errors.check_methods_per_class(tree)
+    result_errors.check_number_of_arguments(tree)
+    result_errors.check_function_lines(tree)
+    result_errors.check_nesting(tree)
+    result_errors.check_indentation(tree)
+
+    return result_errors.errors
+
+
+def bench_single_pass(limit=200):
+    sources = stdlib_sources(limit)
+    lines = sum(code.count('\n') for code in sources)
+    for rules in ({}, RULES, STRICT_RULES):
+        assert all(critic(code, **rules) == legacy_critic(code, **rules)
+                   for code in sources)
+
+    parse = timeit.timeit(lambda: [ast.parse(code) for code in sources],
+                          number=1)
+    legacy = timeit.timeit(
+        lambda: [legacy_critic(code, **RULES) for code in sources],
+        number=1)
+    single_pass = timeit.timeit(
+        lambda: [critic(code, **RULES) for code in sources], number=1)
+    print('single_pass ({} stdlib files, {} lines): parse only {:.2f}s, '
+          'original critic {:.2f}s, single pass {:.2f}s'.format(
+              len(sources), lines, parse, legacy, single_pass))
+
+
+def bench_runner(limit=1000):
+    paths = sorted(glob.glob(os.path.join(os.path.dirname(os.__file__), '**',
+                                          '*.py'), recursive=True))[:limit]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, workers, cache in (('serial', 1, None),
+                                     ('parallel', None, None),
+                                     ('cold cache', None, cache_dir),
+                                     ('warm cache', None, cache_dir)):
+            runner = CriticRunner(workers, cache, **RULES)
+            failed = sum(result.error is not None
+                         for result in runner.run(paths))
+            report = runner.report()
+            print('runner {:>10}: {} files ({} failed) in {:.2f}s, '
+                  '{:.0f} files/s, hit rate {:.0%}'.format(
+                      name, report['files'], failed, report['seconds'],
+                      report['files_per_second'], report['hit_rate']))
+
+
+def synthetic_source(functions=20000):
+    chunks = []
+    for i in range(functions):
+        chunks.append(
+            'def function_{0}(a, b, c):\n'
+            '    total = a + b * c  \n'
+            '    if total > {0}:\n'
+            '        return "{1}"\n'
+            '    return total; total\n\n'.format(i, 'x' * (i % 120)))
+        if i % 10 == 0:
+            chunks.append('def tabbed_{0}():\n\treturn {0}\n\n'.format(i))
+    return ''.join(chunks)
+
+
+def split_line_checks(code, max_length=79):
+    errors = {}
+    split_code = code.split(sep="\n")
+    for line in range(len(split_code)):
+        if len(split_code[line]) > max_length:
+            errors.setdefault(line + 1, []).append('line too long')
+    for line in range(len(split_code)):
+        if re.search(r'\s$', split_code[line]):
+            errors.setdefault(line + 1, []).append('trailing whitespace')
+    return errors
+
+
+def streaming_line_checks(code):
+    errors = Errors()
+    errors.critic_rules['forbid_tabs'] = True
+    errors.run([rule for rule in RULE_CLASSES if rule.checks_lines],
+               lines=iter_lines(code))
+    return errors.errors
+
+
+def peak_memory(function, *args):
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench_line_rules(functions=20000):
+    code = synthetic_source(functions)
+    split = timeit.timeit(lambda: split_line_checks(code), number=1)
+    streaming = timeit.timeit(lambda: streaming_line_checks(code), number=1)
+    print('line_rules ({:.1f} MB): split + regex {:.3f}s / {:.1f} MB peak, '
+          'streaming {:.3f}s / {:.1f} MB peak (with tab rule)'.format(
+              len(code) / 2 ** 20, split,
+              peak_memory(split_line_checks, code) / 2 ** 20, streaming,
+              peak_memory(streaming_line_checks, code) / 2 ** 20))
+
+    for name, newline in (('LF', '\n'), ('CRLF', '\r\n')):
+        with tempfile.NamedTemporaryFile('w', suffix='.py',
+                                         newline=newline) as source:
+            source.write(code)
+            source.flush()
+
+            def from_text():
+                with open(source.name) as text:
+                    return critic(text.read(), **RULES)
+
+            def from_mmap():
+                with open(source.name, 'rb') as binary:
+                    return critic_file(binary, **RULES)
+
+            assert from_text() == from_mmap()
+            print('line_rules ({}): critic(read()) {:.2f}s, '
+                  'critic_file(mmap) {:.2f}s'.format(
+                      name, timeit.timeit(from_text, number=1),
+                      timeit.timeit(from_mmap, number=1)))
+
+
+def bench_incremental(copies=3, edits=200):
+    source = open(os.path.join(os.path.dirname(os.__file__),
+                               'typing.py')).read()
+    code = '\n'.join([source] * copies)
+    full = timeit.timeit(lambda: critic(code, **RULES), number=1)
+    session = IncrementalCritic(code, **RULES)
+    body_lines = [number for number, line in enumerate(session.lines, 1)
+                  if line.startswith('        ') and line.strip()
+                  and not line.strip().startswith(('"', '#'))]
+    random.seed(0)
+    timings = []
+    for i in range(edits):
+        line = random.choice(body_lines)
+        if i % 2:
+            edit = ((line, 0), (line, 0), '        x = 1\n')
+            undo = ((line, 0), (line + 1, 0), '')
+        else:
+            end = len(session.lines[line - 1])
+            edit = ((line, end), (line, end), '  ')
+            undo = ((line, end), (line, end + 2), '')
+        started = time.perf_counter()
+        try:
+            session.edit(*edit)
+        except SyntaxError:
+            session.edit(*undo)
+            continue
+        timings.append(time.perf_counter() - started)
+    assert session.errors == critic(session.code, **RULES)
+    timings.sort()
+    print('incremental ({} lines): full critic {:.1f}ms, {} edits median '
+          '{:.2f}ms, p95 {:.2f}ms'.format(
+              len(session.lines), full * 1000, len(timings),
+              timings[len(timings) // 2] * 1000,
+              timings[int(len(timings) * 0.95)] * 1000))
+
+
+def bench_profile(limit=100):
+    sources = stdlib_sources(limit)
+    plain = timeit.timeit(lambda: [critic(code, **RULES)
+                                   for code in sources], number=1)
+    profile = CriticProfile()
+    profiled = timeit.timeit(lambda: [critic_profile(code, profile, **RULES)
+                                      for code in sources], number=1)
+    report = profile.report()
+    slowest = ', '.join('{} {:.3f}s/{} nodes'.format(
+        name, stats['seconds'], stats['nodes'])
+        for name, stats in list(report['rules'].items())[:3])
+    print('profile ({} files): plain {:.2f}s, profiled {:.2f}s, parse '
+          '{:.2f}s; slowest rules: {}'.format(
+              len(sources), plain, profiled, report['parse_seconds'],
+              slowest))
+
+
+BENCHMARKS = [
+    bench_single_pass,
+    bench_runner,
+    bench_line_rules,
+    bench_incremental,
+    bench_profile
+]
+
+
+if __name__ == '__main__':
+    for benchmark in BENCHMARKS:
+        benchmark()
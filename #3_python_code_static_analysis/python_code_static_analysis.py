@@ -1,6 +1,22 @@
-import re
+import io
+import os
 import ast
-from collections import Counter
+import mmap
+import json
+import inspect
+import time
+import codecs
+import bisect
+import itertools
+import tokenize
+import pickle
+import marshal
+import fnmatch
+import hashlib
+import tracemalloc
+import concurrent.futures
+from importlib.util import decode_source
+from collections import Counter, namedtuple
 
 
 class Errors:
@@ -14,206 +30,883 @@ class Errors:
             "methods_per_class": None,
             "max_arity": None,
             "forbid_trailing_whitespace": True,
-            "max_lines_per_function": None
+            "max_lines_per_function": None,
+            "forbid_tabs": False
         }
         self.lines_with_multiple_expressions = {}
+        self.profile = None
 
     def append_errors(self, new_errors):
         for line, errors in new_errors.items():
             if line in self.errors:
                 self.errors[line] += errors
             else:
-                self.errors[line] = errors
+                self.errors[line] = list(errors)
+
+    def run(self, rule_classes, tree=None, lines=None):
+        rules = [rule for rule in (rule_class(self)
+                                   for rule_class in rule_classes)
+                 if rule.enabled]
+        profile = self.profile
+        if lines is not None:
+            line_checks = [rule.check_line if profile is None
+                           else profile.timed(rule, rule.check_line)
+                           for rule in rules if rule.checks_lines]
+            if line_checks:
+                for number, line in enumerate(lines, 1):
+                    for check_line in line_checks:
+                        check_line(number, line)
+        if tree is not None:
+            ast_rules = [rule for rule in rules if rule.node_types]
+            if profile is None:
+                RuleVisitor(ast_rules).run(tree)
+            else:
+                ProfiledRuleVisitor(ast_rules, profile).run(tree)
+        for rule in rules:
+            if profile is None:
+                rule.finish()
+            else:
+                profile.timed(rule, rule.finish)()
+        for rule in rules:
+            if rule.found:
+                self.append_errors(rule.found)
+        return rules
 
     def check_line_length(self, code):
-        error_message = "line too long ({} > {})"
-        max_length = self.critic_rules['line_length']
-        line_length_errors = {}
-        for line in range(len(code)):
-            line_length = len(code[line])
-            if line_length > max_length:
-                line_length_errors[line + 1] = [
-                    error_message.format(line_length, max_length)]
-
-        if line_length_errors:
-            self.append_errors(line_length_errors)
+        self.run([LineLengthRule], lines=code)
 
     def check_trailing_whitespace(self, code):
-        if not self.critic_rules["forbid_trailing_whitespace"]:
-            return
-        error_message = 'trailing whitespace'
-        whitespace_errors = {}
-        for line in range(len(code)):
-            if re.search(r'\s$', code[line]):
-                whitespace_errors[line + 1] = [error_message]
+        self.run([TrailingWhitespaceRule], lines=code)
 
-        if whitespace_errors:
-            self.append_errors(whitespace_errors)
+    def check_tabs(self, code):
+        self.run([TabsRule], lines=code)
 
     def check_methods_per_class(self, tree):
-        if self.critic_rules['methods_per_class'] is None:
-            return
-        error_message = 'too many methods in class({} > {})'
-        max_methods = self.critic_rules['methods_per_class']
-        methods_per_class_errors = {}
-        methods_counter = 0
-        for node in ast.walk(tree):
-            if isinstance(node, ast.ClassDef):
-                for child in ast.iter_child_nodes(node):
-                    if isinstance(child, ast.FunctionDef):
-                        methods_counter += 1
-                if methods_counter > max_methods:
-                    methods_per_class_errors[node.lineno] = \
-                        [error_message.format(methods_counter, max_methods)]
-                methods_counter = 0
-
-        if methods_per_class_errors:
-            self.append_errors(methods_per_class_errors)
+        self.run([MethodsPerClassRule], tree)
 
     def check_number_of_arguments(self, tree):
-        if self.critic_rules["max_arity"] is None:
-            return
+        self.run([NumberOfArgumentsRule], tree)
 
-        error_message = "too many arguments({} > {})"
-        max_arg = self.critic_rules["max_arity"]
-        number_of_arguments_errors = {}
+    def check_function_lines(self, tree):
+        self.run([FunctionLinesRule], tree)
 
-        functions = [f for f in ast.walk(tree) if
-                     isinstance(f, ast.FunctionDef)]
-        for func in functions:
-            args_counter = len(func.args.args) + bool(func.args.vararg) + bool(
-                func.args.kwarg)
-            if args_counter > max_arg:
-                number_of_arguments_errors[func.lineno] = \
-                    [error_message.format(args_counter, max_arg)]
+    @staticmethod
+    def is_nested(node):
+        return type(node) in NESTED_TYPES
 
-        if number_of_arguments_errors:
-            self.append_errors(number_of_arguments_errors)
+    def check_nesting(self, tree):
+        self.run([NestingRule], tree)
 
-    def check_function_lines(self, tree):
-        if not self.critic_rules["max_lines_per_function"]:
+    @staticmethod
+    def is_logical(node):
+        return type(node) in LOGICAL_TYPES
+
+    def check_indentation(self, tree):
+        self.run([IndentationRule], tree)
+
+    def check_semicolons(self, tree):
+        self.run([SemicolonsRule], tree)
+
+
+NESTED_TYPES = (ast.FunctionDef, ast.ClassDef, ast.If, ast.For, ast.While,
+                ast.Try, ast.With)
+LOGICAL_TYPES = (ast.Expr, ast.Return, ast.Assign)
+
+
+class RuleVisitor(ast.NodeVisitor):
+    def __init__(self, rules):
+        self.rules = rules
+        self.handlers = {}
+        self.parent = None
+
+    def run(self, tree):
+        for rule in self.rules:
+            rule.start(tree)
+        self.visit(tree)
+
+    def dispatch(self, node_type):
+        entering = [rule for rule in self.rules
+                    if node_type in rule.node_types
+                    or ast.AST in rule.node_types]
+        leaving = [rule for rule in entering
+                   if node_type in rule.leave_types]
+        return entering, leaving
+
+    def visit(self, node):
+        node_type = type(node)
+        try:
+            entering, leaving = self.handlers[node_type]
+        except KeyError:
+            entering, leaving = self.handlers[node_type] = \
+                self.dispatch(node_type)
+        parent = self.parent
+        for rule in entering:
+            rule.enter(node, parent)
+        self.parent = node
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        self.visit(item)
+            elif isinstance(value, ast.AST):
+                self.visit(value)
+        self.parent = parent
+        for rule in leaving:
+            rule.leave(node)
+
+
+class ProfiledRuleVisitor(RuleVisitor):
+    def __init__(self, rules, profile):
+        super().__init__(rules)
+        self.profile = profile
+        self.timings = {rule: [0, 0.0] for rule in rules}
+
+    def run(self, tree):
+        super().run(tree)
+        for rule, (nodes, seconds) in self.timings.items():
+            self.profile.add(rule, nodes, seconds, nodes)
+
+    def visit(self, node):
+        node_type = type(node)
+        try:
+            entering, leaving = self.handlers[node_type]
+        except KeyError:
+            entering, leaving = self.handlers[node_type] = \
+                self.dispatch(node_type)
+        self.profile.nodes += 1
+        parent = self.parent
+        for rule in entering:
+            timing = self.timings[rule]
+            started = time.perf_counter()
+            rule.enter(node, parent)
+            timing[1] += time.perf_counter() - started
+            timing[0] += 1
+        self.parent = node
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        self.visit(item)
+            elif isinstance(value, ast.AST):
+                self.visit(value)
+        self.parent = parent
+        for rule in leaving:
+            timing = self.timings[rule]
+            started = time.perf_counter()
+            rule.leave(node)
+            timing[1] += time.perf_counter() - started
+
+
+class CriticProfile:
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.files = 0
+        self.lines = 0
+        self.nodes = 0
+        self.parse_seconds = 0.0
+        self.seconds = 0.0
+        self.peak_memory = 0
+        self.rules = {}
+
+    def add(self, rule, calls, seconds, nodes=0):
+        name = rule if isinstance(rule, str) else type(rule).__name__
+        stats = self.rules.setdefault(name, [0, 0.0, 0])
+        stats[0] += calls
+        stats[1] += seconds
+        stats[2] += nodes
+
+    def timed(self, rule, function):
+        stats = self.rules.setdefault(type(rule).__name__, [0, 0.0, 0])
+
+        def timed_function(*args):
+            started = time.perf_counter()
+            result = function(*args)
+            stats[1] += time.perf_counter() - started
+            stats[0] += 1
+            return result
+        return timed_function
+
+    def merge(self, other):
+        self.files += other.files
+        self.lines += other.lines
+        self.nodes += other.nodes
+        self.parse_seconds += other.parse_seconds
+        self.seconds += other.seconds
+        self.peak_memory = max(self.peak_memory, other.peak_memory)
+        for name, (calls, seconds, nodes) in other.rules.items():
+            self.add(name, calls, seconds, nodes)
+        return self
+
+    def report(self):
+        return {
+            'files': self.files,
+            'lines': self.lines,
+            'nodes': self.nodes,
+            'seconds': self.seconds,
+            'parse_seconds': self.parse_seconds,
+            'peak_memory': self.peak_memory if self.memory else None,
+            'rules': {name: {'calls': calls, 'seconds': seconds,
+                             'nodes': nodes}
+                      for name, (calls, seconds, nodes)
+                      in sorted(self.rules.items(),
+                                key=lambda item: -item[1][1])}
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.report(), **kwargs)
+
+    def dump_stats(self, path):
+        rule_classes = {rule_class.__name__: rule_class
+                        for rule_class in RULES}
+        stats = {}
+        for name, (calls, seconds, nodes) in self.rules.items():
+            rule_class = rule_classes.get(name)
+            line = inspect.getsourcelines(rule_class)[1] if rule_class else 0
+            stats[(__file__, line, name)] = (calls, calls, seconds, seconds,
+                                             {})
+        stats[(__file__, 0, 'ast.parse')] = (self.files, self.files,
+                                             self.parse_seconds,
+                                             self.parse_seconds, {})
+        with open(path, 'wb') as stats_file:
+            marshal.dump(stats, stats_file)
+
+
+class Rule:
+    node_types = ()
+    leave_types = ()
+    checks_lines = False
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.critic_rules = errors.critic_rules
+        self.found = {}
+
+    @property
+    def enabled(self):
+        return True
+
+    def report(self, line, message):
+        self.found.setdefault(line, []).append(message)
+
+    def start(self, tree):
+        pass
+
+    def enter(self, node, parent):
+        pass
+
+    def leave(self, node):
+        pass
+
+    def check_line(self, number, line):
+        pass
+
+    def finish(self):
+        pass
+
+
+class LineLengthRule(Rule):
+    checks_lines = True
+
+    def check_line(self, number, line):
+        max_length = self.critic_rules['line_length']
+        if len(line) > max_length:
+            self.report(number, "line too long ({} > {})".format(len(line),
+                                                                 max_length))
+
+
+class TrailingWhitespaceRule(Rule):
+    checks_lines = True
+
+    @property
+    def enabled(self):
+        return self.critic_rules["forbid_trailing_whitespace"]
+
+    def check_line(self, number, line):
+        if line[-1:].isspace():
+            self.report(number, 'trailing whitespace')
+
+
+class TabsRule(Rule):
+    checks_lines = True
+
+    @property
+    def enabled(self):
+        return self.critic_rules["forbid_tabs"]
+
+    def check_line(self, number, line):
+        if '\t' in line and '\t' in line[:len(line) - len(line.lstrip())]:
+            self.report(number, 'indentation contains tabs')
+
+
+class SemicolonsRule(Rule):
+    node_types = LOGICAL_TYPES
+
+    def start(self, tree):
+        self.line_numbers = []
+
+    def enter(self, node, parent):
+        self.line_numbers.append(node.lineno)
+
+    def finish(self):
+        if len(self.line_numbers) == len(set(self.line_numbers)):
             return
+        line_occurrences = Counter(self.line_numbers)
+        self.errors.lines_with_multiple_expressions = \
+            {line: occurrences for line, occurrences
+             in line_occurrences.items() if occurrences > 1}
+        if self.critic_rules["forbid_semicolons"]:
+            for line in self.errors.lines_with_multiple_expressions:
+                self.report(line, 'multiple expressions on the same line')
 
-        functions = [node for node in ast.walk(tree)
-                     if isinstance(node, ast.FunctionDef)]
-        error_message = 'method with too many lines ({} > {})'
-        lines_per_function_errors = {}
-
-        for func in functions:
-            current_level = [func]
-            lines = []
-            next_level = []
-            while current_level:
-                for node in current_level:
-                    next_level += [n for n in ast.iter_child_nodes(node)
-                                   if not isinstance(n, ast.arguments)]
-                current_lines = [n.lineno for n in current_level
-                                 if hasattr(n, "lineno")]
-                lines += current_lines
-                current_level = next_level
-                next_level = []
-
-            lines_count = len(set(lines))-1
-            if self.lines_with_multiple_expressions:
-                for line, occurrences in \
-                        self.lines_with_multiple_expressions.items():
-                    lines_count += \
-                        (self.lines_with_multiple_expressions[line]-1)
-            if lines_count > self.critic_rules["max_lines_per_function"]:
-                lines_per_function_errors[func.lineno] = \
-                    [error_message.format(lines_count,
-                     self.critic_rules["max_lines_per_function"])]
-
-        if lines_per_function_errors:
-            self.append_errors(lines_per_function_errors)
 
-    @staticmethod
-    def is_nested(node):
-        types = [ast.FunctionDef, ast.ClassDef, ast.If, ast.For, ast.While,
-                 ast.FunctionDef, ast.Try, ast.With]
-        return type(node) in types
+class MethodsPerClassRule(Rule):
+    node_types = (ast.ClassDef,)
+
+    @property
+    def enabled(self):
+        return self.critic_rules['methods_per_class'] is not None
 
-    def check_nesting(self, tree, nesting_counter=0):
-        if self.critic_rules["max_nesting"] is None:
+    def enter(self, node, parent):
+        max_methods = self.critic_rules['methods_per_class']
+        methods_counter = sum(isinstance(child, ast.FunctionDef)
+                              for child in ast.iter_child_nodes(node))
+        if methods_counter > max_methods:
+            self.report(node.lineno, 'too many methods in class({} > {})'.
+                        format(methods_counter, max_methods))
+
+
+class NumberOfArgumentsRule(Rule):
+    node_types = (ast.FunctionDef,)
+
+    @property
+    def enabled(self):
+        return self.critic_rules["max_arity"] is not None
+
+    def enter(self, node, parent):
+        max_arg = self.critic_rules["max_arity"]
+        args_counter = len(node.args.args) + bool(node.args.vararg) + bool(
+            node.args.kwarg)
+        if args_counter > max_arg:
+            self.report(node.lineno, "too many arguments({} > {})".format(
+                args_counter, max_arg))
+
+
+class FunctionLinesRule(Rule):
+    node_types = (ast.AST,)
+    leave_types = (ast.arguments, ast.FunctionDef)
+
+    @property
+    def enabled(self):
+        return bool(self.critic_rules["max_lines_per_function"])
+
+    def start(self, tree):
+        self.open_functions = []
+        self.arguments_depth = 0
+        self.line_counts = []
+
+    def enter(self, node, parent):
+        node_type = type(node)
+        if node_type is ast.arguments:
+            self.arguments_depth += 1
+        elif node_type is ast.FunctionDef:
+            self.open_functions.append(set())
+        if self.open_functions and not self.arguments_depth:
+            lineno = getattr(node, 'lineno', None)
+            if lineno is not None:
+                self.open_functions[-1].add(lineno)
+
+    def leave(self, node):
+        if type(node) is ast.arguments:
+            self.arguments_depth -= 1
+        else:
+            lines = self.open_functions.pop()
+            self.line_counts.append((node.lineno, len(lines) - 1))
+            if self.open_functions:
+                self.open_functions[-1] |= lines
+
+    def finish(self):
+        extra_lines = sum(occurrences - 1 for occurrences in
+                          self.errors.lines_with_multiple_expressions.values())
+        self.report_counts(self.line_counts, extra_lines)
+
+    def report_counts(self, line_counts, extra_lines):
+        max_lines = self.critic_rules["max_lines_per_function"]
+        for line, lines_count in line_counts:
+            if lines_count + extra_lines > max_lines:
+                self.report(line, 'method with too many lines ({} > {})'.
+                            format(lines_count + extra_lines, max_lines))
+
+
+class BlockRule(Rule):
+    node_types = NESTED_TYPES
+
+    def start(self, tree):
+        self.depths = {id(tree): 0}
+
+    def enter(self, node, parent):
+        parent_depth = self.depths.get(id(parent))
+        if parent_depth is None:
             return
+        if type(node) in NESTED_TYPES:
+            self.depths[id(node)] = parent_depth + 1
+        self.check_block(node, parent, parent_depth)
 
-        error_message = 'nesting too deep ({} > {})'
-        nesting_errors = {}
-        if nesting_counter > self.critic_rules["max_nesting"]:
-            nesting_errors[(tree.lineno + 1)] = \
-                [error_message.format
-                 (nesting_counter, self.critic_rules["max_nesting"])]
+    def check_block(self, node, parent, parent_depth):
+        pass
 
-        if nesting_errors:
-            self.append_errors(nesting_errors)
 
-        for node in ast.iter_child_nodes(tree):
-            if self.is_nested(node):
-                self.check_nesting(node, (nesting_counter + 1))
+class NestingRule(BlockRule):
+    @property
+    def enabled(self):
+        return self.critic_rules["max_nesting"] is not None
 
-    @staticmethod
-    def is_logical(node):
-        types = [ast.Expr, ast.Return, ast.Assign]
-        return type(node) in types
-
-    def check_indentation(self, tree, expected_indentation=0):
-        error_message = 'indentation is {} instead of {}'
-        indentation_errors = {}
-        nodes = [node for node in ast.iter_child_nodes(tree)
-                 if self.is_nested(node) or self.is_logical(node)]
-        checked_lines = set()
-
-        for node in nodes:
-            if node.col_offset != expected_indentation \
-                    and node.lineno not in checked_lines:
-                indentation_errors[node.lineno] = \
-                    [error_message.format(node.col_offset,
-                                          expected_indentation)]
-            if hasattr(node, 'lineno'):
-                    checked_lines.add(node.lineno)
-
-        if indentation_errors:
-            self.append_errors(indentation_errors)
-        for node in ast.iter_child_nodes(tree):
-            if self.is_nested(node):
-                self.check_indentation(node,
-                                       (expected_indentation +
-                                        self.critic_rules["indentation_size"]))
+    def check_block(self, node, parent, parent_depth):
+        max_nesting = self.critic_rules["max_nesting"]
+        if parent_depth + 1 > max_nesting:
+            self.report(node.lineno + 1, 'nesting too deep ({} > {})'.format(
+                parent_depth + 1, max_nesting))
+
+
+class IndentationRule(BlockRule):
+    node_types = NESTED_TYPES + LOGICAL_TYPES
+
+    def start(self, tree):
+        super().start(tree)
+        self.checked_lines = {}
+
+    def check_block(self, node, parent, parent_depth):
+        expected_indentation = parent_depth * \
+            self.critic_rules["indentation_size"]
+        checked_lines = self.checked_lines.setdefault(id(parent), set())
+        if node.col_offset != expected_indentation \
+                and node.lineno not in checked_lines:
+            self.report(node.lineno, 'indentation is {} instead of {}'.format(
+                node.col_offset, expected_indentation))
+        checked_lines.add(node.lineno)
+
+
+LINE_RULES = [LineLengthRule, TrailingWhitespaceRule, TabsRule]
+AST_RULES = [SemicolonsRule, MethodsPerClassRule, NumberOfArgumentsRule,
+             FunctionLinesRule, NestingRule, IndentationRule]
+RULES = LINE_RULES + AST_RULES
+
+
+def iter_lines(code):
+    newline = '\n' if isinstance(code, str) else b'\n'
+    find = code.find
+    start = 0
+    end = find(newline)
+    while end != -1:
+        yield code[start:end]
+        start = end + 1
+        end = find(newline, start)
+    yield code[start:]
 
-    def check_semicolons(self, tree):
-        error_message = 'multiple expressions on the same line'
-        semicolon_errors = {}
-        line_numbers = []
-
-        for node in ast.walk(tree):
-            if self.is_logical(node):
-                line_numbers.append(node.lineno)
-
-        if len(line_numbers) != len(set(line_numbers)):
-            line_occurrences = Counter(line_numbers)
-            self.lines_with_multiple_expressions = \
-                {line: occurrences for line, occurrences
-                 in line_occurrences.items() if occurrences > 1}
-            for line, occurrences in \
-                    self.lines_with_multiple_expressions.items():
-                semicolon_errors[line] = [error_message]
-        if semicolon_errors and self.critic_rules["forbid_semicolons"]:
-            self.append_errors(semicolon_errors)
+
+def iter_buffer_lines(buffer):
+    raw_lines = iter_lines(buffer)
+
+    def readline():
+        line = next(raw_lines, None)
+        return b'' if line is None else line + b'\n'
+
+    encoding, first_lines = tokenize.detect_encoding(readline)
+    decode = codecs.getincrementaldecoder(encoding)().decode
+    lines = itertools.chain((line[:-1] for line in first_lines), raw_lines)
+    line = next(lines)
+    for following in lines:
+        yield from decode(line).removesuffix('\r').split('\r')
+        line = following
+    yield from decode(line).split('\r')
 
 
 def critic(code, **rules):
     result_errors = Errors()
     result_errors.critic_rules.update(rules)
-    split_code = code.split(sep="\n")
     tree = ast.parse(code, mode="exec")
 
-    result_errors.check_line_length(split_code)
-    result_errors.check_trailing_whitespace(split_code)
-    result_errors.check_semicolons(tree)
-    result_errors.check_methods_per_class(tree)
-    result_errors.check_number_of_arguments(tree)
-    result_errors.check_function_lines(tree)
-    result_errors.check_nesting(tree)
-    result_errors.check_indentation(tree)
+    result_errors.run(RULES, tree, iter_lines(code))
 
     return result_errors.errors
+
+
+def critic_profile(code, profile=None, **rules):
+    if profile is None:
+        profile = CriticProfile()
+    tracing = profile.memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result_errors = Errors()
+        result_errors.critic_rules.update(rules)
+        result_errors.profile = profile
+        tree = ast.parse(code, mode="exec")
+        profile.parse_seconds += time.perf_counter() - started
+
+        result_errors.run(RULES, tree, iter_lines(code))
+    finally:
+        profile.seconds += time.perf_counter() - started
+        if tracing:
+            profile.peak_memory = max(profile.peak_memory,
+                                      tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    profile.files += 1
+    profile.lines += code.count('\n') + 1
+
+    return result_errors.errors, profile
+
+
+def critic_buffer(buffer, **rules):
+    result_errors = Errors()
+    result_errors.critic_rules.update(rules)
+    tree = ast.parse(buffer, mode="exec")
+
+    result_errors.run(RULES, tree, iter_buffer_lines(buffer))
+
+    return result_errors.errors
+
+
+def critic_file(source_file, **rules):
+    if isinstance(source_file, io.TextIOBase):
+        return critic(source_file.read(), **rules)
+    try:
+        buffer = mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return critic_buffer(source_file.read(), **rules)
+    with buffer:
+        return critic_buffer(buffer, **rules)
+
+
+class AnalysisBlock:
+    def __init__(self, start, end, found, line_counts, extra_lines):
+        self.start = start
+        self.end = end
+        self.found = found
+        self.line_counts = line_counts
+        self.extra_lines = extra_lines
+
+
+class IncrementalCritic:
+    def __init__(self, code, **rules):
+        self.context = Errors()
+        self.context.critic_rules.update(rules)
+        self.line_rules = [rule for rule in (rule_class(self.context)
+                                             for rule_class in LINE_RULES)
+                           if rule.enabled]
+        self.function_lines = FunctionLinesRule(self.context)
+        self.lines = code.split(sep="\n")
+        self.errors = {}
+        self.reanalyse()
+
+    @property
+    def code(self):
+        return '\n'.join(self.lines)
+
+    def reanalyse(self):
+        blocks = self._analyse_region(1, len(self.lines))
+        self.blocks = blocks
+        self.starts = [block.start for block in blocks]
+        self.dirty = None
+        self.function_errors = self._function_errors()
+        self.errors.clear()
+        for line in range(1, len(self.lines) + 2):
+            self._assemble(line)
+        return self.errors
+
+    def edit(self, start, end, text):
+        (start_line, start_column), (end_line, end_column) = start, end
+        new_lines = (self.lines[start_line - 1][:start_column] + text +
+                     self.lines[end_line - 1][end_column:]).split(sep="\n")
+        delta = len(new_lines) - (end_line - start_line + 1)
+        self.lines[start_line - 1:end_line] = new_lines
+        if self.dirty is not None:
+            start_line = min(start_line, self.dirty[0])
+            end_line = max(end_line, self.dirty[1])
+
+        blocks = self.blocks
+        first = bisect.bisect_left([block.end for block in blocks],
+                                   start_line)
+        last = bisect.bisect_right(self.starts, end_line)
+        new_blocks = None
+        for widen in (0, 1):
+            first, last = max(first - widen, 0), min(last + widen,
+                                                     len(blocks))
+            region_start = blocks[first - 1].end + 1 if first else 1
+            region_end = (blocks[last].start - 1 if last < len(blocks)
+                          else len(self.lines) - delta)
+            try:
+                new_blocks = self._analyse_region(region_start,
+                                                  region_end + delta)
+                break
+            except SyntaxError:
+                pass
+
+        for block in blocks[last:]:
+            block.start += delta
+            block.end += delta
+        blocks[first:last] = new_blocks or []
+        self.starts = [block.start for block in blocks]
+        old_function_errors = self.function_errors
+        for lines in (self.errors, old_function_errors):
+            self._shift_lines(lines, region_start, region_end + 1, delta)
+        if new_blocks is None:
+            self.dirty = (region_start, region_end + delta)
+            ast.parse(self.code, mode="exec")
+            return self.reanalyse()
+
+        self.dirty = None
+        self.function_errors = self._function_errors()
+        for line in range(region_start, region_end + delta + 2):
+            self._assemble(line)
+        for line in old_function_errors.keys() | self.function_errors.keys():
+            if old_function_errors.get(line) != \
+                    self.function_errors.get(line):
+                self._assemble(line)
+        return self.errors
+
+    def _analyse_region(self, first_line, last_line):
+        tree = ast.parse('\n'.join(self.lines[first_line - 1:last_line]),
+                         mode="exec")
+        groups = []
+        for statement in tree.body:
+            start = min([statement.lineno] +
+                        [decorator.lineno for decorator
+                         in getattr(statement, 'decorator_list', ())])
+            if groups and start <= groups[-1][1]:
+                groups[-1][1] = max(groups[-1][1], statement.end_lineno)
+                groups[-1][2].append(statement)
+            else:
+                groups.append([start, statement.end_lineno, [statement]])
+        return [self._analyse_block(start + first_line - 1,
+                                    end + first_line - 1,
+                                    statements, start)
+                for start, end, statements in groups]
+
+    def _analyse_block(self, start, end, statements, relative_start):
+        errors = Errors()
+        errors.critic_rules.update(self.context.critic_rules)
+        rules = errors.run(AST_RULES, ast.Module(body=statements,
+                                                 type_ignores=[]))
+        found = {}
+        line_counts = []
+        for rule in rules:
+            if isinstance(rule, FunctionLinesRule):
+                line_counts = [(line - relative_start, lines_count)
+                               for line, lines_count in rule.line_counts]
+            elif rule.found:
+                found[type(rule)] = {line - relative_start: messages
+                                     for line, messages in rule.found.items()}
+        extra_lines = sum(occurrences - 1 for occurrences in
+                          errors.lines_with_multiple_expressions.values())
+        return AnalysisBlock(start, end, found, line_counts, extra_lines)
+
+    def _function_errors(self):
+        self.function_lines.found = {}
+        if self.function_lines.enabled:
+            self.function_lines.report_counts(
+                [(block.start + line, lines_count) for block in self.blocks
+                 for line, lines_count in block.line_counts],
+                sum(block.extra_lines for block in self.blocks))
+        return self.function_lines.found
+
+    @staticmethod
+    def _shift_lines(lines, first_line, last_line, delta):
+        moved = []
+        for line in list(lines):
+            if line >= first_line:
+                messages = lines.pop(line)
+                if line > last_line:
+                    moved.append((line + delta, messages))
+        lines.update(moved)
+
+    def _neighbours(self, line):
+        index = bisect.bisect_right(self.starts, line) - 1
+        neighbours = []
+        if index > 0 and self.blocks[index - 1].end + 1 == line:
+            neighbours.append(self.blocks[index - 1])
+        if index >= 0 and line <= self.blocks[index].end + 1:
+            neighbours.append(self.blocks[index])
+        return neighbours
+
+    def _assemble(self, line):
+        messages = []
+        if line <= len(self.lines):
+            for rule in self.line_rules:
+                rule.check_line(line, self.lines[line - 1])
+                messages.extend(rule.found.pop(line, ()))
+        neighbours = self._neighbours(line)
+        for rule_class in AST_RULES:
+            if rule_class is FunctionLinesRule:
+                messages.extend(self.function_errors.get(line, ()))
+                continue
+            for block in neighbours:
+                messages.extend(
+                    block.found.get(rule_class, {}).get(line - block.start,
+                                                        ()))
+        if messages:
+            self.errors[line] = messages
+        else:
+            self.errors.pop(line, None)
+
+
+CriticResult = namedtuple('CriticResult', 'path errors error cached')
+
+
+class ResultCache:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key):
+        try:
+            with open(self.entry_path(key), 'rb') as entry:
+                return pickle.load(entry)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, key, errors):
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'wb') as entry:
+            pickle.dump(errors, entry, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+
+
+class CriticRunner:
+    def __init__(self, workers=None, cache_dir=None, chunksize=16, **rules):
+        self.workers = workers
+        self.chunksize = chunksize
+        self.rules = rules
+        critic_rules = Errors().critic_rules
+        critic_rules.update(rules)
+        self.rules_key = repr(sorted(critic_rules.items())).encode()
+        self.cache = ResultCache(cache_dir) if cache_dir else None
+        self.files = 0
+        self.cached = 0
+        self.seconds = 0.0
+        self.profile = None
+
+    def cache_key(self, source):
+        return hashlib.sha256(self.rules_key + b'\0' + source).hexdigest()
+
+    def report(self):
+        return {
+            'files': self.files,
+            'cached': self.cached,
+            'hit_rate': self.cached / self.files if self.files else 0.0,
+            'seconds': self.seconds,
+            'files_per_second':
+                self.files / self.seconds if self.seconds else 0.0
+        }
+
+    def run_directory(self, directory, pattern='*.py'):
+        return self.run(sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(directory)
+            for name in fnmatch.filter(names, pattern)))
+
+    def run(self, paths):
+        started = time.perf_counter()
+        try:
+            if self.workers is not None and self.workers <= 1:
+                for chunk in self._chunks(paths):
+                    if isinstance(chunk, CriticResult):
+                        yield self._count(chunk)
+                    else:
+                        yield from self._collect(
+                            _critic_chunk(chunk, self.rules,
+                                          self._profile_memory()))
+            else:
+                yield from self._run_parallel(paths)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+    def _run_parallel(self, paths):
+        executor = None
+        max_pending = 2 * (self.workers or os.cpu_count() or 1)
+        pending = set()
+        try:
+            for chunk in self._chunks(paths):
+                if isinstance(chunk, CriticResult):
+                    yield self._count(chunk)
+                    continue
+                if executor is None:
+                    executor = concurrent.futures.ProcessPoolExecutor(
+                        self.workers)
+                pending.add(executor.submit(_critic_chunk, chunk, self.rules,
+                                            self._profile_memory()))
+                if len(pending) >= max_pending:
+                    done, pending = concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        yield from self._collect(future.result())
+            for future in concurrent.futures.as_completed(pending):
+                yield from self._collect(future.result())
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    def _chunks(self, paths):
+        chunk = []
+        for path in paths:
+            try:
+                with open(path, 'rb') as source_file:
+                    source = source_file.read()
+            except OSError as error:
+                yield CriticResult(path, None, error, False)
+                continue
+            key = self.cache_key(source)
+            errors = self.cache.get(key) if self.cache else None
+            if errors is not None:
+                yield CriticResult(path, errors, None, True)
+                continue
+            chunk.append((path, key, source))
+            if len(chunk) == self.chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _count(self, result):
+        self.files += 1
+        self.cached += result.cached
+        return result
+
+    def _profile_memory(self):
+        return None if self.profile is None else self.profile.memory
+
+    def _collect(self, chunk_results):
+        results, profile = chunk_results
+        if profile is not None:
+            self.profile.merge(profile)
+        for path, key, errors, error in results:
+            if error is None and self.cache:
+                self.cache.put(key, errors)
+            yield self._count(CriticResult(path, errors, error, False))
+
+
+def _critic_chunk(chunk, rules, profile_memory=None):
+    profile = None if profile_memory is None else CriticProfile(profile_memory)
+    results = []
+    for path, key, source in chunk:
+        try:
+            code = decode_source(source)
+            if profile is None:
+                errors = critic(code, **rules)
+            else:
+                errors = critic_profile(code, profile, **rules)[0]
+            results.append((path, key, errors, None))
+        except (SyntaxError, ValueError, RecursionError) as error:
+            results.append((path, key, None, error))
+    return results, profile
+
+
+def critic_directory(directory, workers=None, cache_dir=None, **rules):
+    return CriticRunner(workers, cache_dir, **rules).run_directory(directory)